@@ -0,0 +1,347 @@
+import threading
+
+from collections import Counter
+from instrumentation import instrumentation
+from kernels import column_sum
+from rollups import DIMENSIONS, RollupCube
+from sessions import DEFAULT_GAP_MINUTES, Sessions
+from sketches import DEFAULT_ERROR, Estimates, ItemSketch
+
+BATCH_SIZE = 65536
+
+STATISTICS = {}
+
+# Registered but only built when asked for by name, e.g. AggregateEngine(names=["rollup_cube"]).
+OPTIONAL_STATISTICS = set()
+
+# Sketch-based replacements used in approximate mode, memory stays bounded by the error setting.
+APPROXIMATE_STATISTICS = {}
+
+# Results read from another statistic's result, e.g. trend tables from the rollup cube.
+DERIVED_RESULTS = {}
+
+def register_statistic(name, approximate=False, optional=False):
+    def register(cls):
+        cls.name = name
+        (APPROXIMATE_STATISTICS if approximate else STATISTICS)[name] = cls
+        if optional:
+            OPTIONAL_STATISTICS.add(name)
+        return cls
+    return register
+
+def register_result(name, statistic):
+    def register(function):
+        DERIVED_RESULTS[name] = (statistic, function)
+        return function
+    return register
+
+def count_values(store, column, start, stop, counter, rows=None):
+    # Counting the integer codes runs in C, only the distinct codes of a batch are decoded.
+    codes = getattr(store, column)
+    batch = codes[start:stop] if rows is None else (codes[index] for index in rows)
+    values = store.table(column).values
+    for code, count in Counter(batch).items():
+        counter[values[code]] += count
+
+class Statistic:
+    # Set when the state holds codes of the store's lookup tables, which then have to stay the same across batches.
+    keeps_codes = False
+
+    @classmethod
+    def create(cls, options):
+        # options are the engine settings, e.g. the sketch error or the session gap.
+        return cls()
+
+    def update(self, store, start, stop):
+        raise NotImplementedError
+
+    def merge(self, other):
+        # Adds the partial state of the same statistic computed over other plays, e.g. another file.
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+@register_statistic("plays")
+class PlayCount(Statistic):
+    def __init__(self):
+        self.plays = 0
+
+    def update(self, store, start, stop):
+        self.plays += stop - start
+
+    def merge(self, other):
+        self.plays += other.plays
+
+    def result(self):
+        return self.plays
+
+@register_statistic("total_ms")
+class TotalPlaytime(Statistic):
+    def __init__(self):
+        self.total_ms = 0
+
+    def update(self, store, start, stop):
+        self.total_ms += column_sum(store.ms_played[start:stop])
+
+    def merge(self, other):
+        self.total_ms += other.total_ms
+
+    def result(self):
+        return self.total_ms
+
+@register_statistic("first_last")
+class FirstAndLastPlay(Statistic):
+    def __init__(self):
+        # Ordered by timestamp so partials of unsorted or separate files merge, ties keep the file order.
+        self.first_ts = None
+        self.first = None
+        self.last_ts = None
+        self.last = None
+
+    def update(self, store, start, stop):
+        if start == stop:
+            return
+        ts = store.ts
+        first_ts = min(ts[start:stop])
+        if self.first_ts is None or first_ts < self.first_ts:
+            self.first_ts, self.first = first_ts, store.record(ts.index(first_ts, start, stop))
+        last_ts = max(ts[start:stop])
+        if self.last_ts is None or last_ts >= self.last_ts:
+            self.last_ts, self.last = last_ts, store.record(stop - 1 - ts[start:stop][::-1].index(last_ts))
+
+    def merge(self, other):
+        if other.first_ts is not None and (self.first_ts is None or other.first_ts < self.first_ts):
+            self.first_ts, self.first = other.first_ts, other.first
+        if other.last_ts is not None and (self.last_ts is None or other.last_ts >= self.last_ts):
+            self.last_ts, self.last = other.last_ts, other.last
+
+    def result(self):
+        return self.first, self.last
+
+class ValueCounter(Statistic):
+    column = None
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def update(self, store, start, stop):
+        count_values(store, self.column, start, stop, self.counts)
+
+    def merge(self, other):
+        # Counts are keyed by value, partials of stores with different lookup tables add up directly.
+        self.counts.update(other.counts)
+
+    def result(self):
+        return self.counts
+
+@register_statistic("tracks")
+class TrackCounter(ValueCounter):
+    column = "track"
+
+@register_statistic("artists")
+class ArtistCounter(ValueCounter):
+    column = "artist"
+
+@register_statistic("platforms")
+class PlatformCounter(ValueCounter):
+    column = "platform"
+
+@register_statistic("reason_start")
+class StartReasonCounter(ValueCounter):
+    column = "reason_start"
+
+@register_statistic("reason_end")
+class EndReasonCounter(ValueCounter):
+    column = "reason_end"
+
+@register_statistic("skipped_tracks")
+class SkippedTrackCounter(ValueCounter):
+    column = "track"
+
+    def update(self, store, start, stop):
+        count_values(store, self.column, start, stop, self.counts, store.skipped.set_indices(start, stop))
+
+class SketchCounter(Statistic):
+    column = None
+
+    def __init__(self, error=DEFAULT_ERROR):
+        self.sketch = ItemSketch(error)
+
+    @classmethod
+    def create(cls, options):
+        return cls(options["error"])
+
+    def batch_counts(self, store, start, stop):
+        counts = Counter()
+        count_values(store, self.column, start, stop, counts)
+        return counts
+
+    def update(self, store, start, stop):
+        self.sketch.update(self.batch_counts(store, start, stop))
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+
+    def result(self):
+        return self.sketch.estimates()
+
+@register_statistic("tracks", approximate=True)
+class TrackSketch(SketchCounter):
+    column = "track"
+
+@register_statistic("artists", approximate=True)
+class ArtistSketch(SketchCounter):
+    column = "artist"
+
+@register_statistic("skipped_tracks", approximate=True)
+class SkippedTrackSketch(SketchCounter):
+    column = "track"
+
+    def batch_counts(self, store, start, stop):
+        counts = Counter()
+        count_values(store, self.column, start, stop, counts, store.skipped.set_indices(start, stop))
+        return counts
+
+@register_statistic("rollups")
+class Rollups(Statistic):
+    # Totals per period only, all the analyses, graphs and the export need.
+    dimensions = ("period",)
+
+    def __init__(self):
+        self.cube = RollupCube(self.dimensions)
+
+    def update(self, store, start, stop):
+        self.cube.update(store, start, stop)
+
+    def merge(self, other):
+        self.cube.merge(other.cube)
+
+    def result(self):
+        return self.cube
+
+@register_statistic("rollup_cube", optional=True)
+class DimensionRollups(Rollups):
+    # Also split by track, artist and platform, this cube can be larger than the store.
+    dimensions = DIMENSIONS
+    keeps_codes = True
+
+@register_statistic("sessions")
+class ListeningSessions(Statistic):
+    def __init__(self, gap_minutes=DEFAULT_GAP_MINUTES):
+        self.sessions = Sessions(gap_minutes)
+
+    @classmethod
+    def create(cls, options):
+        return cls(options["session_gap"])
+
+    def update(self, store, start, stop):
+        self.sessions.update(store, start, stop)
+
+    def merge(self, other):
+        self.sessions.merge(other.sessions)
+
+    def result(self):
+        return self.sessions
+
+def distinct_count(counts):
+    if isinstance(counts, Estimates):
+        return counts.distinct
+    return sum(1 for value in counts if value is not None)
+
+@register_result("unique_tracks", "tracks")
+def unique_tracks(counts):
+    return distinct_count(counts)
+
+@register_result("unique_artists", "artists")
+def unique_artists(counts):
+    return distinct_count(counts)
+
+@register_result("session_summary", "sessions")
+def session_summary(sessions):
+    return sessions.summary()
+
+@register_result("plays_per_day", "rollups")
+def plays_per_day(cube):
+    return cube.totals("day")
+
+@register_result("plays_per_year", "rollups")
+def plays_per_year(cube):
+    return cube.totals("year")
+
+@register_result("ms_per_weekday", "rollups")
+def ms_per_weekday(cube):
+    total_ms = {}
+    for day, ms_played in cube.totals("day", "ms_played").items():
+        weekday = (day + 3) % 7
+        total_ms[weekday] = total_ms.get(weekday, 0) + ms_played
+    return total_ms
+
+@register_result("ms_per_month", "rollups")
+def ms_per_month(cube):
+    return cube.totals("month", "ms_played")
+
+@register_result("plays_per_month", "rollups")
+def plays_per_month(cube):
+    return cube.totals("month")
+
+class AggregateEngine:
+    def __init__(self, store=None, names=None, batch_size=BATCH_SIZE, approximate=False, error=DEFAULT_ERROR,
+                 session_gap=DEFAULT_GAP_MINUTES):
+        self.store = store
+        self.batch_size = batch_size
+        self.approximate = approximate
+        options = {"error": error, "session_gap": session_gap}
+        names = names or [name for name in STATISTICS if name not in OPTIONAL_STATISTICS]
+        names = [DERIVED_RESULTS[name][0] if name in DERIVED_RESULTS else name for name in names]
+        self.statistics = {name: (APPROXIMATE_STATISTICS[name] if approximate and name in APPROXIMATE_STATISTICS
+                                  else STATISTICS[name]).create(options) for name in dict.fromkeys(names)}
+        self.rows_seen = 0
+        self.cached_results = None
+        self.lock = threading.RLock()
+
+    def keeps_codes(self):
+        return any(statistic.keeps_codes for statistic in self.statistics.values())
+
+    def refresh(self, progress=None):
+        # Background jobs may refresh concurrently, batches are applied under the lock.
+        with self.lock:
+            if self.store is None or self.rows_seen >= len(self.store):
+                return
+            self.consume(self.store, self.rows_seen, len(self.store), progress)
+
+    def consume(self, store, start, stop, progress=None):
+        # Rows of an external store, e.g. an ingest batch, are added without being tracked by refresh.
+        with self.lock:
+            # One pass over the rows, every statistic consumes each batch while it is hot.
+            for batch_start in range(start, stop, self.batch_size):
+                if progress is not None:
+                    progress((batch_start - start) / (stop - start), "Analyzing")
+                batch_stop = min(batch_start + self.batch_size, stop)
+                for name, statistic in self.statistics.items():
+                    with instrumentation.part(f"aggregate {name}"):
+                        statistic.update(store, batch_start, batch_stop)
+                if store is self.store:
+                    self.rows_seen = batch_stop
+                self.cached_results = None
+
+    def merge(self, statistics):
+        # Partial statistics of another engine, e.g. returned by a worker process for one file.
+        with self.lock:
+            for name, statistic in statistics.items():
+                self.statistics[name].merge(statistic)
+            self.cached_results = None
+
+    def results(self):
+        with self.lock:
+            self.refresh()
+            if self.cached_results is None:
+                results = {name: statistic.result() for name, statistic in self.statistics.items()}
+                for name, (statistic, function) in DERIVED_RESULTS.items():
+                    if statistic in results:
+                        results[name] = function(results[statistic])
+                self.cached_results = results
+            return self.cached_results
+
+    def get(self, name):
+        return self.results()[name]
@@ -0,0 +1,334 @@
+import os
+import calendar
+
+from concurrent.futures import ProcessPoolExecutor
+from collections import namedtuple
+from aggregates import AggregateEngine
+from ingest import detect_format, history_files, ingest_file, ingest_records, iter_ndjson_range, split_ndjson
+from instrumentation import instrumentation
+from kernels import top_items
+from play_index import filter_store
+from play_store import day_to_date
+from sessions import DEFAULT_GAP_MINUTES
+from sketches import DEFAULT_ERROR
+
+# Importable without tkinter or matplotlib, the GUI and the CLI both build on these functions.
+
+Analysis = namedtuple("Analysis", ["label", "compute", "format"])
+
+def load_play_store(file_path, play_cache=None, skip_podcasts=False, progress=None):
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f"The file '{file_path}' does not exist.")
+
+    play_store = None
+    if play_cache is not None:
+        with instrumentation.part("cache read"):
+            play_store = play_cache.load(file_path, skip_podcasts)
+    if play_store is None:
+        try:
+            play_store = ingest_file(file_path, play_cache=play_cache, progress=progress, skip_podcasts=skip_podcasts)
+        except OSError:
+            # The cache folder is not writable, load without it.
+            play_store = ingest_file(file_path, progress=progress, skip_podcasts=skip_podcasts)
+    return play_store
+
+def ranked(counter, key_name, count_name, top=5, unknown=None):
+    # Sketch estimates in approximate mode carry the most any count can be over-estimated by.
+    approximate = hasattr(counter, "max_overcount")
+    max_overcount = counter.max_overcount if approximate else 0
+    items = counter.items()
+    if unknown is not None:
+        merged = {}
+        for item, count in items:
+            item = unknown if item is None else item
+            merged[item] = merged.get(item, 0) + count
+        items = merged.items()
+    items = top_items(items, top) if top else sorted(items, key=lambda x: x[1], reverse=True)
+    return [{"rank": rank, key_name: item, count_name: count, "approximate": approximate, "max_overcount": max_overcount}
+            for rank, (item, count) in enumerate(items, start=1)]
+
+def format_approximate_note(result, count_name):
+    if not result or not result[0]["approximate"]:
+        return ""
+    return f"Approximate counts, each is over-estimated by at most {result[0]['max_overcount']} {count_name}.\n"
+
+def total_songs(results):
+    return {"total_songs": results["plays"]}
+
+def format_total_songs(result):
+    return f"Total number of songs listened: {result['total_songs']}\n\n"
+
+def total_time(results):
+    total_time_ms = results["total_ms"]
+    total_time_sec = total_time_ms / 1000
+    total_time_min, total_time_sec = divmod(total_time_sec, 60)
+    total_time_hr, total_time_min = divmod(total_time_min, 60)
+    total_time_days, total_time_hr = divmod(total_time_hr, 24)
+    return {"total_ms": total_time_ms, "days": int(total_time_days), "hours": int(total_time_hr),
+            "minutes": int(total_time_min), "seconds": int(total_time_sec)}
+
+def format_total_time(result):
+    return f"Total time spent listened: {result['days']} days, {result['hours']} hours, {result['minutes']} minutes, {result['seconds']} seconds\n\n"
+
+def first_and_last(results):
+    first_song, last_song = results["first_last"]
+    return {"first": first_song, "last": last_song}
+
+def format_song_info(song):
+    title = song.get('master_metadata_track_name', 'Unknown Title')
+    artist = song.get('master_metadata_album_artist_name', 'Unknown Artist')
+    timestamp_str = song.get('ts', 'Unknown Timestamp')
+
+    formatted_timestamp = f"{timestamp_str[:10]} at {timestamp_str[11:19]}"
+
+    return f'"{title}" by "{artist}" on {formatted_timestamp}\n'
+
+def format_first_and_last(result):
+    if result["first"] is None:
+        return "No plays found.\n\n"
+    text = f"First song played: {format_song_info(result['first'])}\n"
+    text += f"Last song played: {format_song_info(result['last'])}\n"
+    return text
+
+def top_songs(results, top=5):
+    return ranked(results["tracks"], "song", "plays", top, unknown="Unknown")
+
+def top_artists(results, top=5):
+    return ranked(results["artists"], "artist", "plays", top, unknown="Unknown")
+
+def format_top_items(result, item_name, key_name):
+    text = f"Top 5 most played {item_name}s:\n"
+    for row in result:
+        about = "about " if row["approximate"] else ""
+        text += f"{row['rank']}. {row[key_name]}, Plays: {about}{row['plays']}\n"
+    return text + format_approximate_note(result, "plays") + "\n"
+
+def format_top_songs(result):
+    return format_top_items(result, "Song", "song")
+
+def format_top_artists(result):
+    return format_top_items(result, "Artist", "artist")
+
+def most_skipped(results, top=5):
+    return ranked(results["skipped_tracks"], "song", "skips", top)
+
+def format_most_skipped(result):
+    text = "Top 5 most skipped songs:\n"
+    for row in result:
+        about = "about " if row["approximate"] else ""
+        text += f"{row['rank']}. {row['song']}, Skips: {about}{row['skips']}\n"
+    return text + format_approximate_note(result, "skips") + "\n"
+
+def average_duration(results):
+    plays = results["plays"]
+    return {"average_minutes": results["total_ms"] / plays / 60000 if plays else 0.0}
+
+def format_average_duration(result):
+    return f"Average song duration: {result['average_minutes']:.2f} minutes\n\n"
+
+def daily_patterns(results):
+    return [{"date": day_to_date(day).isoformat(), "plays": plays} for day, plays in sorted(results["plays_per_day"].items())]
+
+def format_daily_patterns(result):
+    text = "Daily listening patterns:\n"
+    for row in result:
+        text += f"{row['date']}: {row['plays']} plays\n"
+    return text
+
+def yearly(results):
+    return [{"year": year, "plays": plays} for year, plays in sorted(results["plays_per_year"].items())]
+
+def format_yearly(result):
+    text = "Listening statistics by year:\n"
+    for row in result:
+        text += f"{row['year']}: {row['plays']} plays\n"
+    return text + "\n"
+
+def monthly(results):
+    ms_per_month = results["ms_per_month"]
+    return [{"month": f"{month // 100}-{month % 100:02d}", "plays": plays, "hours": ms_per_month[month] / (1000 * 60 * 60)}
+            for month, plays in sorted(results["plays_per_month"].items())]
+
+def format_monthly(result):
+    text = "Listening statistics by month:\n"
+    for row in result:
+        text += f"{row['month']}: {row['plays']} plays, {row['hours']:.2f} hours\n"
+    return text + "\n"
+
+def weekday_playtime(results):
+    return [{"weekday": calendar.day_name[weekday], "hours": total_ms / (1000 * 60 * 60)}
+            for weekday, total_ms in sorted(results["ms_per_weekday"].items())]
+
+def format_weekday_playtime(result):
+    text = "Daily playtime statistics:\n"
+    for row in result:
+        text += f"{row['weekday']}: {row['hours']:.2f} hours\n"
+    return text + "\n"
+
+def devices(results):
+    return [{"rank": rank, "device": device, "plays": plays}
+            for rank, (device, plays) in enumerate(results["platforms"].most_common(), start=1)]
+
+def format_devices(result):
+    text = "Analysis of most used devices:\n"
+    for row in result:
+        text += f"{row['rank']}. {row['device']}: {row['plays']} plays\n"
+    return text + "\n"
+
+def unique_counts(results):
+    # Sketch estimates in approximate mode, exact counts otherwise.
+    return {"unique_songs": results["unique_tracks"], "unique_artists": results["unique_artists"],
+            "approximate": hasattr(results["tracks"], "distinct")}
+
+def format_unique_counts(result):
+    about = "about " if result["approximate"] else ""
+    text = f"Unique songs listened: {about}{result['unique_songs']}\n"
+    text += f"Unique artists listened: {about}{result['unique_artists']}\n"
+    return text + "\n"
+
+def listening_sessions(results):
+    summary = results["session_summary"]
+    if summary is None:
+        return {"sessions": [], "start_reasons": []}
+    row = {name: summary[name] for name in ("gap_minutes", "sessions", "average_minutes", "longest_minutes",
+                                            "average_tracks", "skip_rate", "unsorted")}
+    return {"sessions": [row],
+            "start_reasons": [{"reason": reason, "count": count} for reason, count in summary["start_reasons"].most_common()]}
+
+def format_listening_sessions(result):
+    if not result["sessions"]:
+        return "No listening sessions found.\n\n"
+    row = result["sessions"][0]
+    text = f"Listening sessions (a new session starts after {row['gap_minutes']:g} minutes without playback):\n"
+    text += f"Number of sessions: {row['sessions']}\n"
+    text += f"Average session length: {row['average_minutes']:.1f} minutes\n"
+    text += f"Longest session: {row['longest_minutes']:.1f} minutes\n"
+    text += f"Average tracks per session: {row['average_tracks']:.1f}\n"
+    text += f"Average skip rate per session: {row['skip_rate']:.1%}\n"
+    if row["unsorted"]:
+        text += "Warning: the plays are not in time order, sessions may be split or joined wrongly. Sort them with merge_json.py.\n"
+    text += "\nSession start reasons:\n"
+    for reason in result["start_reasons"]:
+        text += f"{reason['reason']}: {reason['count']} sessions\n"
+    return text + "\n"
+
+def playback_reasons(results):
+    return {"start": [{"reason": reason, "count": count} for reason, count in results["reason_start"].items()],
+            "end": [{"reason": reason, "count": count} for reason, count in results["reason_end"].items()]}
+
+def format_playback_reasons(result):
+    text = "Playback start reasons:\n"
+    for row in result["start"]:
+        text += f"{row['reason']}: {row['count']} times\n"
+    text += "\nPlayback end reasons:\n"
+    for row in result["end"]:
+        text += f"{row['reason']}: {row['count']} times\n"
+    return text
+
+ANALYSES = {
+    "total_songs": Analysis("Show total of songs listened", total_songs, format_total_songs),
+    "total_time": Analysis("Total time spent listened", total_time, format_total_time),
+    "first_and_last": Analysis("Show first and last played songs", first_and_last, format_first_and_last),
+    "top_songs": Analysis("Show the top 5 most played songs", top_songs, format_top_songs),
+    "top_artists": Analysis("Show the top 5 most played artists", top_artists, format_top_artists),
+    "most_skipped": Analysis("Show the most skipped songs", most_skipped, format_most_skipped),
+    "average_duration": Analysis("Show the average song duration", average_duration, format_average_duration),
+    "daily_patterns": Analysis("Show daily listening patterns", daily_patterns, format_daily_patterns),
+    "yearly": Analysis("Show yearly statistics", yearly, format_yearly),
+    "monthly": Analysis("Show monthly statistics", monthly, format_monthly),
+    "weekday_playtime": Analysis("Show daily playtime statistics", weekday_playtime, format_weekday_playtime),
+    "devices": Analysis("Show analysis of most used devices", devices, format_devices),
+    "unique_counts": Analysis("Show unique songs and artists", unique_counts, format_unique_counts),
+    "sessions": Analysis("Show listening sessions", listening_sessions, format_listening_sessions),
+    "playback_reasons": Analysis("Analyze playback reasons", playback_reasons, format_playback_reasons),
+}
+
+ANALYSES_BY_LABEL = {analysis.label: name for name, analysis in ANALYSES.items()}
+
+def run_analyses(aggregates, names=None):
+    results = aggregates.results()
+    reports = {}
+    for name in names or ANALYSES:
+        with instrumentation.part(f"analysis {name}"):
+            reports[name] = ANALYSES[name].compute(results)
+    return reports
+
+def aggregate_file(file_path, play_cache=None, play_filter=None, approximate=False, error=DEFAULT_ERROR,
+                   session_gap=DEFAULT_GAP_MINUTES, skip_podcasts=False, byte_range=None):
+    # Runs in a worker process, only the partial statistics are sent back.
+    aggregates = AggregateEngine(approximate=approximate, error=error, session_gap=session_gap)
+    if byte_range is not None:
+        # One part of an NDJSON file, its lines are read from the (start, end) byte offsets.
+        ingest_records(iter_ndjson_range(file_path, *byte_range), aggregates=aggregates, keep_rows=False,
+                       skip_podcasts=skip_podcasts)
+    elif play_cache is None and (play_filter is None or play_filter.is_empty()):
+        ingest_file(file_path, aggregates=aggregates, keep_rows=False, skip_podcasts=skip_podcasts)
+    else:
+        play_store = filter_store(load_play_store(file_path, play_cache, skip_podcasts), play_filter)
+        aggregates.consume(play_store, 0, len(play_store))
+    return aggregates.statistics
+
+def aggregate_files(file_paths, workers=None, play_cache=None, play_filter=None, approximate=False, error=DEFAULT_ERROR,
+                    progress=None, session_gap=DEFAULT_GAP_MINUTES, skip_podcasts=False):
+    # Files are parsed and aggregated independently, their partials merge without building a merged history.
+    # Sessions crossing a file or part boundary are joined when the partials merge, files are expected in time order.
+    aggregates = AggregateEngine(approximate=approximate, error=error, session_gap=session_gap)
+    # With more workers than files, NDJSON files are split at line starts and their parts run in parallel.
+    # Parts are read straight from the file, so only without the cache and filters.
+    parts = (workers or os.cpu_count() or 1) // max(len(file_paths), 1)
+    split = parts > 1 and play_cache is None and (play_filter is None or play_filter.is_empty())
+    jobs = []
+    for file_path in file_paths:
+        byte_ranges = split_ndjson(file_path, parts) if split and detect_format(file_path) == "ndjson" else [None]
+        jobs.extend((file_path, play_cache, play_filter, approximate, error, session_gap, skip_podcasts, byte_range)
+                    for byte_range in byte_ranges)
+
+    if workers == 1 or len(jobs) <= 1:
+        for done, job in enumerate(jobs, start=1):
+            aggregates.merge(aggregate_file(*job))
+            if progress is not None:
+                progress(done / len(jobs), "Analyzing files")
+        return aggregates
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(aggregate_file, *job) for job in jobs]
+        # Merged in file order, equal timestamps in different files resolve the same way every time.
+        for done, future in enumerate(futures, start=1):
+            aggregates.merge(future.result())
+            if progress is not None:
+                progress(done / len(jobs), "Analyzing files")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return aggregates
+
+def analyze_folder(folder, names=None, play_cache=None, play_filter=None, approximate=False, error=DEFAULT_ERROR, workers=None,
+                   session_gap=DEFAULT_GAP_MINUTES, skip_podcasts=False):
+    file_paths = history_files(folder)
+    if not file_paths:
+        raise FileNotFoundError(f"The folder '{folder}' does not contain any JSON files.")
+    with instrumentation.phase(f"analyze folder {os.path.basename(os.path.normpath(folder))}") as phase:
+        aggregates = aggregate_files(file_paths, workers, play_cache, play_filter, approximate, error, session_gap=session_gap,
+                                     skip_podcasts=skip_podcasts)
+        phase.rows = aggregates.get("plays")
+        return run_analyses(aggregates, names)
+
+def analyze_file(file_path, names=None, play_cache=None, streaming=False, play_filter=None, approximate=False,
+                 error=DEFAULT_ERROR, session_gap=DEFAULT_GAP_MINUTES, skip_podcasts=False, workers=1):
+    if streaming and play_filter is not None and not play_filter.is_empty():
+        raise ValueError("Filters need the plays in memory and cannot be combined with streaming.")
+
+    with instrumentation.phase(f"analyze {os.path.basename(file_path)}") as phase:
+        if streaming:
+            # Aggregates are fed batch by batch and the plays are dropped, memory stays bounded.
+            if not os.path.isfile(file_path):
+                raise FileNotFoundError(f"The file '{file_path}' does not exist.")
+            # Several workers aggregate parts of an NDJSON file in parallel.
+            aggregates = aggregate_files([file_path], workers, approximate=approximate, error=error, session_gap=session_gap,
+                                         skip_podcasts=skip_podcasts)
+        else:
+            play_store = filter_store(load_play_store(file_path, play_cache, skip_podcasts), play_filter)
+            aggregates = AggregateEngine(play_store, approximate=approximate, error=error, session_gap=session_gap)
+        reports = run_analyses(aggregates, names)
+        phase.rows = aggregates.get("plays")
+    return reports
@@ -0,0 +1,285 @@
+import os
+import sys
+import json
+import time
+import pickle
+import random
+import shutil
+import calendar
+import argparse
+import tempfile
+import kernels
+
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+from aggregates import AggregateEngine
+from analysis import ANALYSES, aggregate_file, load_play_store
+from ingest import BATCH_SIZE, history_files
+from instrumentation import environment, instrumentation
+from merge_json import merge_and_sort_json, merge_and_sort_json_streaming
+from play_cache import PlayCache
+from play_store import TIMESTAMP_FORMAT, Bitmap, parse_timestamp, parse_timestamps
+from synthetic_history import DEFAULT_SEED, write_history
+
+try:
+    import charts
+except ImportError:
+    charts = None
+
+try:
+    import excel_export
+except ImportError:
+    excel_export = None
+
+KERNEL_BATCH_SIZE = 65536
+
+SUITE_SIZES = [10000, 100000, 1000000, 10000000]
+SUITE_FILES = 4
+SUITE_REPEAT = 3
+# The in-memory merge and the workbook would take minutes and gigabytes beyond these sizes.
+IN_MEMORY_MERGE_LIMIT = 1000000
+EXPORT_ROW_LIMIT = 1000000
+REGRESSION_TOLERANCE = 0.2
+# Differences below this are timer noise, e.g. for analyses that only read the aggregates.
+MIN_REGRESSION_SECONDS = 0.01
+
+def synthetic_timestamps(rows, seed=0):
+    rng = random.Random(seed)
+    current = datetime(2015, 1, 1)
+    timestamps = []
+    for _ in range(rows):
+        current += timedelta(seconds=rng.randint(30, 600))
+        timestamps.append(current.strftime(TIMESTAMP_FORMAT))
+    return timestamps
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+def parse_with_strptime(timestamps):
+    return [calendar.timegm(datetime.strptime(ts, TIMESTAMP_FORMAT).timetuple()) for ts in timestamps]
+
+def parse_with_fixed_format(timestamps):
+    day_cache = {}
+    return [parse_timestamp(ts, day_cache)[0] for ts in timestamps]
+
+def parse_batches(timestamps):
+    day_cache = {}
+    seconds = []
+    for start in range(0, len(timestamps), BATCH_SIZE):
+        seconds.extend(parse_timestamps(timestamps[start:start + BATCH_SIZE], day_cache)[0])
+    return seconds
+
+def benchmark_timestamps(rows):
+    timestamps = synthetic_timestamps(rows)
+
+    strptime_time, expected = timed(parse_with_strptime, timestamps)
+    fixed_time, parsed = timed(parse_with_fixed_format, timestamps)
+    batch_time, batch_parsed = timed(parse_batches, timestamps)
+
+    if parsed != expected or batch_parsed != expected:
+        raise AssertionError("Fixed-format parser disagrees with strptime")
+
+    print(f"Timestamp parsing, {rows} rows:")
+    print(f"  strptime: {strptime_time:.2f} s")
+    print(f"  fixed-format parser: {fixed_time:.2f} s ({strptime_time / fixed_time:.1f}x faster)")
+    print(f"  batch parser: {batch_time:.2f} s ({strptime_time / batch_time:.1f}x faster)")
+    # The original analyses ran strptime once per record in six places.
+    print(f"  six strptime passes (previous analyses): {6 * strptime_time:.2f} s")
+
+def synthetic_columns(rows, seed=0):
+    # Typed columns shaped like a real history: skewed track popularity, a few platforms, ~10% skips.
+    rng = random.Random(seed)
+    columns = {
+        "ms_played": array('q', (rng.randint(0, 300000) for _ in range(rows))),
+        "day": array('i', sorted(rng.randint(16000, 20000) for _ in range(rows))),
+        "track": array('i', (min(int(rng.paretovariate(0.8)), 1 << 20) for _ in range(rows))),
+        "platform": array('i', (rng.randint(0, 5) for _ in range(rows))),
+    }
+    columns["artist"] = array('i', (track % 5000 for track in columns["track"]))
+    skipped = Bitmap()
+    for _ in range(rows):
+        skipped.append(rng.random() < 0.1)
+    columns["skipped"] = skipped
+    return columns
+
+def kernel_calls(columns, start, stop):
+    # The calls the aggregates, rollups, graphs and top lists make for one batch.
+    keys = [columns[name][start:stop] for name in ("day", "track", "artist", "platform")]
+    ms_played = columns["ms_played"][start:stop]
+    return {
+        "column_sum": lambda selected: kernels.column_sum(ms_played, selected),
+        "histogram": lambda selected: kernels.histogram(ms_played, 20, selected),
+        "group_totals": lambda selected: kernels.group_totals(keys, [ms_played], [(columns["skipped"], start, stop)], selected),
+        "top_items": lambda selected: kernels.top_items(Counter(keys[1]).items(), 5, selected),
+    }
+
+def benchmark_kernels(rows_list):
+    backends = [name for name in kernels.BACKENDS if name == "python" or kernels.np is not None]
+    if len(backends) == 1:
+        print("NumPy is not installed, only the python backend is timed and no parity check is possible.")
+
+    for rows in rows_list:
+        columns = synthetic_columns(rows)
+        timings = {}
+        for start in range(0, rows, KERNEL_BATCH_SIZE):
+            calls = kernel_calls(columns, start, min(start + KERNEL_BATCH_SIZE, rows))
+            for name, call in calls.items():
+                results = {}
+                for selected in backends:
+                    elapsed, results[selected] = timed(call, selected)
+                    timings[(name, selected)] = timings.get((name, selected), 0) + elapsed
+                # Parity: every backend must give the python fallback's exact result.
+                for selected, result in results.items():
+                    if result != results["python"]:
+                        raise AssertionError(f"{name}: the {selected} backend disagrees with the python fallback")
+
+        print(f"Analysis kernels, {rows} rows:")
+        for name in kernel_calls(columns, 0, 0):
+            line = ", ".join(f"{selected}: {timings[(name, selected)]:.2f} s" for selected in backends)
+            if len(backends) > 1:
+                line += f" ({timings[(name, 'python')] / timings[(name, 'numpy')]:.1f}x faster with numpy)"
+            print(f"  {name}: {line}")
+
+def suite_history(data_dir, rows, files):
+    # Generated once per size and reused, the fixed seed makes every run time the same plays.
+    folder = os.path.join(data_dir, f"history_{rows}_{files}_seed{DEFAULT_SEED}")
+    marker = os.path.join(folder, "complete")
+    if not os.path.exists(marker):
+        shutil.rmtree(folder, ignore_errors=True)
+        print(f"  generating {rows} synthetic plays in {folder}...")
+        write_history(folder, rows, files)
+        open(marker, 'w').close()
+    return folder
+
+def run_stage(results, rows, stage, function, repeat, scans_plays=True):
+    # The fastest of the repeats is kept, it is the least disturbed by the rest of the machine.
+    best = None
+    for _ in range(repeat):
+        with instrumentation.phase(f"{stage} ({rows} rows)", rows) as phase:
+            value = function()
+        if best is None or phase.wall < best.wall:
+            best = phase
+    results.append({"rows": rows, "stage": stage, "wall_seconds": best.wall, "cpu_seconds": best.cpu,
+                    "peak_memory_bytes": best.peak_memory, "memory_source": best.memory_source})
+    line = f"  {stage}: {best.wall:.3f} s wall, {best.cpu:.3f} s CPU"
+    if scans_plays and best.wall > 0:
+        line += f" ({rows / best.wall:,.0f} rows/s)"
+    print(line)
+    return value
+
+def aggregate(store):
+    aggregates = AggregateEngine(store)
+    aggregates.results()
+    return aggregates
+
+def merge_partials(partials):
+    # What the parent does with the partials of a folder's worker processes before the first result is shown.
+    aggregates = AggregateEngine()
+    for partial in partials:
+        aggregates.merge(pickle.loads(partial))
+    aggregates.results()
+    return aggregates
+
+def benchmark_suite(sizes, files=SUITE_FILES, data_dir=None, repeat=SUITE_REPEAT, export_limit=EXPORT_ROW_LIMIT):
+    # The steps a user goes through: merge the export, open it, pick each option, the graphs and the export.
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), "spotify_analyzer_benchmark")
+    if charts is None:
+        print("matplotlib or tkinter is not installed, the graphs are not timed.")
+    if excel_export is None:
+        print("openpyxl is not installed, the Excel export is not timed.")
+
+    results = []
+    for rows in sizes:
+        print(f"Benchmark suite, {rows} rows in {files} files:")
+        folder = suite_history(data_dir, rows, files)
+        with tempfile.TemporaryDirectory(prefix="spotify_benchmark_") as work_dir:
+            merged = os.path.join(work_dir, "merged.json")
+            run_stage(results, rows, "merge streaming", lambda: merge_and_sort_json_streaming(folder, merged), repeat)
+            if rows <= IN_MEMORY_MERGE_LIMIT:
+                run_stage(results, rows, "merge in memory", lambda: merge_and_sort_json(folder, merged), repeat)
+
+            store = run_stage(results, rows, "load", lambda: load_play_store(merged), repeat)
+            play_cache = PlayCache(os.path.join(work_dir, "cache"))
+            load_play_store(merged, play_cache)
+            run_stage(results, rows, "load cached", lambda: load_play_store(merged, play_cache), repeat)
+
+            aggregates = run_stage(results, rows, "aggregate", lambda: aggregate(store), repeat)
+            partials = [pickle.dumps(aggregate_file(file_path)) for file_path in history_files(folder)]
+            run_stage(results, rows, "merge folder partials", lambda: merge_partials(partials), repeat, False)
+            aggregate_results = aggregates.results()
+            for name, analysis in ANALYSES.items():
+                run_stage(results, rows, f"analysis {name}",
+                          lambda analysis=analysis: analysis.format(analysis.compute(aggregate_results)), repeat, False)
+
+            if charts is not None:
+                data = charts.ChartData(None, aggregates, store)
+                for name, chart in charts.CHARTS.items():
+                    run_stage(results, rows, f"graph {name}", lambda chart=chart: chart.compute(data), repeat, False)
+
+            if excel_export is not None and rows <= export_limit:
+                excel_file_path = os.path.join(work_dir, "history.xlsx")
+                run_stage(results, rows, "export",
+                          lambda: excel_export.export_plays(store, aggregate_results, excel_file_path), repeat)
+    return results
+
+def compare_results(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    previous = {(result["rows"], result["stage"]): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get((result["rows"], result["stage"]))
+        if before is None:
+            continue
+        change = result["wall_seconds"] - before["wall_seconds"]
+        if change > MIN_REGRESSION_SECONDS and change > tolerance * before["wall_seconds"]:
+            regressions.append((result, before))
+
+    if baseline.get("environment") != environment_key():
+        print("The baseline was recorded on a different machine, Python or backend, timings may not be comparable.")
+    for result, before in regressions:
+        print(f"Regression: {result['stage']} at {result['rows']} rows took {result['wall_seconds']:.3f} s, "
+              f"{before['wall_seconds']:.3f} s before ({result['wall_seconds'] / before['wall_seconds'] - 1:+.0%})")
+    if not regressions:
+        print(f"No stage is more than {tolerance:.0%} slower than the baseline.")
+    return regressions
+
+def environment_key():
+    return {name: value for name, value in environment().items() if name != "created"}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark Spotify Analyzer internals on synthetic data.')
+    parser.add_argument('--rows', type=int, default=1000000, help='Number of synthetic plays')
+    parser.add_argument('--kernels', nargs='*', type=int, metavar='ROWS',
+                        help='Check and time the python and numpy analysis kernels (default sizes: 100k, 1M and 10M rows)')
+
+    parser.add_argument('--suite', nargs='*', type=int, metavar='ROWS',
+                        help='Time merge, load, every analysis, the graphs and the export on synthetic histories '
+                             '(default sizes: 10k, 100k, 1M and 10M rows)')
+    parser.add_argument('--files', type=int, default=SUITE_FILES, help='Number of files each synthetic history is split into')
+    parser.add_argument('--data-dir', type=str, default=None, help='Folder where the synthetic histories are kept between runs')
+    parser.add_argument('--repeat', type=int, default=SUITE_REPEAT, help='Runs per stage, the fastest one is reported')
+    parser.add_argument('--export-limit', type=int, default=EXPORT_ROW_LIMIT, help='Largest history exported to Excel')
+    parser.add_argument('--output', type=str, default=None, help='Save the suite results to this JSON file')
+    parser.add_argument('--compare', type=str, default=None, metavar='BASELINE',
+                        help='Compare with the results of an earlier --output and fail on regressions')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help=f'Slowdown of a stage counted as a regression (default: {REGRESSION_TOLERANCE})')
+
+    args = parser.parse_args()
+    if args.suite is not None:
+        results = benchmark_suite(args.suite or SUITE_SIZES, args.files, args.data_dir, max(args.repeat, 1), args.export_limit)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as output:
+                json.dump({"environment": environment_key(), "created": environment()["created"], "files": args.files,
+                           "seed": DEFAULT_SEED, "repeat": args.repeat, "results": results}, output, indent=2)
+            print(f"Results saved to {args.output}")
+        if args.compare:
+            with open(args.compare, 'r', encoding='utf-8') as baseline:
+                if compare_results(results, json.load(baseline), args.tolerance):
+                    sys.exit(1)
+    elif args.kernels is not None:
+        benchmark_kernels(args.kernels or [100000, 1000000, 10000000])
+    else:
+        benchmark_timestamps(args.rows)
@@ -0,0 +1,228 @@
+import math
+import tkinter as tk
+import matplotlib.dates as mdates # type: ignore
+
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, namedtuple
+from matplotlib.figure import Figure # type: ignore
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk # type: ignore
+from kernels import histogram, top_items
+from play_store import EPOCH
+
+MAX_CACHED_FIGURES = 8
+MAX_CACHED_SERIES = 32
+FINE_HISTOGRAM_BINS = 2000
+DISTRIBUTION_BINS = 20
+MARKER_LIMIT = 200
+
+# Day numbers count from 1970-01-01, matplotlib dates from its own epoch.
+DATE_OFFSET = mdates.date2num(EPOCH)
+
+Chart = namedtuple("Chart", ["label", "compute", "draw"])
+
+class ChartData:
+    # What a chart is computed from, key identifies the dataset and filter for the caches.
+    def __init__(self, key, aggregates, store=None):
+        self.key = key
+        self.aggregates = aggregates
+        self.store = store
+
+def lttb(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: keeps the points that shape the line, one per bucket.
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return list(x), list(y)
+    sampled_x = [x[0]]
+    sampled_y = [y[0]]
+    every = (length - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        average_start = int((bucket + 1) * every) + 1
+        average_stop = min(int((bucket + 2) * every) + 1, length)
+        average_x = sum(x[average_start:average_stop]) / (average_stop - average_start)
+        average_y = sum(y[average_start:average_stop]) / (average_stop - average_start)
+        point_x, point_y = x[previous], y[previous]
+        previous = max(range(int(bucket * every) + 1, int((bucket + 1) * every) + 1),
+                       key=lambda index: abs((point_x - average_x) * (y[index] - point_y) - (point_x - x[index]) * (average_y - point_y)))
+        sampled_x.append(x[previous])
+        sampled_y.append(y[previous])
+    sampled_x.append(x[-1])
+    sampled_y.append(y[-1])
+    return sampled_x, sampled_y
+
+def visible_points(x, y, low, high, max_points):
+    # The points inside the view plus one on each side, downsampled to about one per pixel.
+    start = max(bisect_left(x, low) - 1, 0)
+    stop = min(bisect_right(x, high) + 1, len(x))
+    return lttb(x[start:stop], y[start:stop], max_points)
+
+def rebin(counts, edges, low=None, high=None, bins=DISTRIBUTION_BINS):
+    # Groups the fine bins inside the view into about `bins` bars, zooming in shows finer bars.
+    first = 0 if low is None else max(bisect_right(edges, low) - 1, 0)
+    last = len(counts) if high is None else min(bisect_left(edges, high), len(counts))
+    size = max(1, math.ceil((last - first) / bins))
+    lefts, heights, widths = [], [], []
+    for start in range(first, last, size):
+        stop = min(start + size, last)
+        lefts.append(edges[start])
+        heights.append(sum(counts[start:stop]))
+        widths.append(edges[stop] - edges[start])
+    return lefts, heights, widths
+
+def top_songs_series(data):
+    played_songs = Counter()
+    for song, plays in data.aggregates.get("tracks").items():
+        played_songs[song if song is not None else "None"] += plays
+    return top_items(played_songs.items(), 5)
+
+def top_artists_series(data):
+    return top_items(data.aggregates.get("artists").items(), 5)
+
+def distribution_series(data):
+    # One pass over the plays, every later zoom re-bins these fine bins.
+    counts, edges = histogram(data.store.ms_played, FINE_HISTOGRAM_BINS)
+    return counts, [edge / 1000 for edge in edges]
+
+def trends_series(data):
+    plays_per_date = sorted(data.aggregates.get("plays_per_day").items())
+    return [day + DATE_OFFSET for day, _ in plays_per_date], [plays for _, plays in plays_per_date]
+
+def draw_top_bars(figure, top_played, color, ylabel, title):
+    axes = figure.add_subplot()
+    axes.barh([name for name, _ in top_played], [plays for _, plays in top_played], color=color)
+    axes.set_xlabel('Plays')
+    axes.set_ylabel(ylabel)
+    axes.set_title(title)
+    figure.tight_layout()
+
+def draw_top_songs(figure, series):
+    draw_top_bars(figure, series, 'lightblue', 'Songs', 'Top Played Songs')
+
+def draw_top_artists(figure, series):
+    draw_top_bars(figure, series, 'lightcoral', 'Artists', 'Top Played Artists')
+
+def draw_distribution(figure, series):
+    counts, edges = series
+    axes = figure.add_subplot()
+    bars = [axes.bar(*rebin(counts, edges), align='edge', color='green', alpha=0.7)]
+    axes.set_xlabel('Playback Time (seconds)')
+    axes.set_ylabel('Number of Songs')
+    axes.set_title('Distribution of Playback Times for Songs')
+    figure.tight_layout()
+    axes.set_autoscalex_on(False)
+
+    def on_zoom(axes):
+        bars[0].remove()
+        low, high = axes.get_xlim()
+        bars[0] = axes.bar(*rebin(counts, edges, low, high), align='edge', color='green', alpha=0.7)
+        axes.relim()
+        axes.autoscale_view(scalex=False)
+        axes.figure.canvas.draw_idle()
+
+    axes.callbacks.connect('xlim_changed', on_zoom)
+
+def draw_trends(figure, series):
+    x, y = series
+    axes = figure.add_subplot()
+    max_points = int(axes.bbox.width) or len(x)
+    shown_x, shown_y = lttb(x, y, max_points)
+    line, = axes.plot(shown_x, shown_y, marker='o' if len(shown_x) == len(x) and len(x) <= MARKER_LIMIT else None)
+    axes.xaxis_date()
+    axes.set_xlabel('Date')
+    axes.set_ylabel('Number of Plays')
+    axes.set_title('Playback Trends Over Time')
+    for label in axes.get_xticklabels():
+        label.set_rotation(45)
+    figure.tight_layout()
+    axes.set_autoscalex_on(False)
+
+    def on_zoom(axes):
+        low, high = axes.get_xlim()
+        line.set_data(*visible_points(x, y, low, high, int(axes.bbox.width)))
+        line.set_marker('')
+        axes.figure.canvas.draw_idle()
+
+    axes.callbacks.connect('xlim_changed', on_zoom)
+
+CHARTS = {
+    "top_songs": Chart("Show Top Played Songs", top_songs_series, draw_top_songs),
+    "top_artists": Chart("Show Top Artists", top_artists_series, draw_top_artists),
+    "distribution": Chart("Show Playback Time Distribution", distribution_series, draw_distribution),
+    "trends": Chart("Show Playback Trends", trends_series, draw_trends),
+}
+
+class ChartWindow:
+    # One window and one embedded canvas, figures are swapped in instead of opening a new window per graph.
+    def __init__(self, root, jobs, on_select, on_error=None):
+        self.jobs = jobs
+        self.on_error = on_error
+        self.series = OrderedDict()
+        self.figures = OrderedDict()
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Graph Options")
+
+        label = tk.Label(self.window, text="Choose a graph to display:")
+        label.pack(pady=10)
+
+        buttons_frame = tk.Frame(self.window)
+        buttons_frame.pack()
+        for column, (name, chart) in enumerate(CHARTS.items()):
+            button = tk.Button(buttons_frame, text=chart.label, command=lambda name=name: on_select(name))
+            button.grid(row=0, column=column, padx=5)
+
+        self.canvas = FigureCanvasTkAgg(Figure(figsize=(10, 6)), master=self.window)
+        self.toolbar = NavigationToolbar2Tk(self.canvas, self.window)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+    def exists(self):
+        return bool(self.window.winfo_exists())
+
+    def lift(self):
+        self.window.lift()
+
+    def show(self, name, data):
+        key = (data.key, name)
+        figure = self.figures.get(key)
+        if figure is not None:
+            self.figures.move_to_end(key)
+            self.display(figure)
+            return
+
+        series = self.series.get(key)
+        if series is not None:
+            self.series.move_to_end(key)
+            self.draw(key, name, series)
+            return
+
+        self.jobs.submit("graphs", lambda job: CHARTS[name].compute(data),
+                         on_done=lambda series: self.on_series(key, name, series),
+                         on_error=self.on_error)
+
+    def on_series(self, key, name, series):
+        remember(self.series, key, series, MAX_CACHED_SERIES)
+        self.draw(key, name, series)
+
+    def draw(self, key, name, series):
+        figure = Figure(figsize=(10, 6))
+        # Attached before drawing so the axes know their size on screen.
+        self.display(figure)
+        CHARTS[name].draw(figure, series)
+        self.canvas.draw_idle()
+        remember(self.figures, key, figure, MAX_CACHED_FIGURES)
+
+    def display(self, figure):
+        widget = self.canvas.get_tk_widget()
+        width, height = widget.winfo_width(), widget.winfo_height()
+        if width > 1 and height > 1:
+            figure.set_size_inches(width / figure.dpi, height / figure.dpi, forward=False)
+        self.canvas.figure = figure
+        figure.set_canvas(self.canvas)
+        self.toolbar.update()
+        self.canvas.draw_idle()
+
+def remember(cache, key, value, limit):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > limit:
+        cache.popitem(last=False)
@@ -0,0 +1,80 @@
+import tkinter as tk
+
+from tkinter import filedialog
+from instrumentation import instrumentation
+
+class DiagnosticsWindow:
+    # Timings of the recorded phases, with buttons to save them as JSON and to capture profiles for a bug report.
+    def __init__(self, root):
+        self.window = tk.Toplevel(root)
+        self.window.title("Diagnostics")
+
+        buttons_frame = tk.Frame(self.window)
+        buttons_frame.pack(pady=10)
+
+        refresh_button = tk.Button(buttons_frame, text="Refresh", command=self.refresh)
+        refresh_button.grid(row=0, column=0, padx=5)
+
+        save_button = tk.Button(buttons_frame, text="Save as JSON", command=self.save)
+        save_button.grid(row=0, column=1, padx=5)
+
+        clear_button = tk.Button(buttons_frame, text="Clear", command=self.clear)
+        clear_button.grid(row=0, column=2, padx=5)
+
+        self.capture_var = tk.BooleanVar(self.window, value=instrumentation.capture_folder is not None)
+        capture_button = tk.Checkbutton(buttons_frame, text="Capture profiles (slower)", variable=self.capture_var,
+                                        command=self.toggle_capture)
+        capture_button.grid(row=0, column=3, padx=5)
+
+        self.capture_label = tk.Label(self.window, text="", font=("Arial", 11))
+        self.capture_label.pack(anchor=tk.W, padx=10)
+
+        self.text = tk.Text(self.window, height=30, width=110, wrap=tk.NONE, font=("Courier", 11))
+        self.text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.text.config(state=tk.DISABLED)
+
+        self.refresh()
+
+    def exists(self):
+        return bool(self.window.winfo_exists())
+
+    def lift(self):
+        self.window.lift()
+        self.refresh()
+
+    def refresh(self):
+        folder = instrumentation.capture_folder
+        self.capture_label.config(text=f"Profiles and allocations are saved to {folder}" if folder else "Capture mode is off.")
+        self.text.config(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        self.text.insert(tk.END, instrumentation.report())
+        self.text.config(state=tk.DISABLED)
+
+    def save(self):
+        path = filedialog.asksaveasfilename(parent=self.window, title="Save Diagnostics", defaultextension=".json",
+                                            filetypes=[("JSON files", "*.json")])
+        if path:
+            try:
+                instrumentation.dump(path)
+            except OSError as e:
+                self.capture_label.config(text=f"Error saving diagnostics: {e}")
+
+    def clear(self):
+        instrumentation.clear()
+        self.refresh()
+
+    def toggle_capture(self):
+        if not self.capture_var.get():
+            instrumentation.stop_capture()
+        else:
+            folder = filedialog.askdirectory(parent=self.window, title="Select Folder for Profiles")
+            if not folder:
+                self.capture_var.set(False)
+            else:
+                try:
+                    instrumentation.start_capture(folder)
+                except OSError as e:
+                    self.capture_var.set(False)
+                    self.capture_label.config(text=f"Error starting capture: {e}")
+                    return
+        self.refresh()
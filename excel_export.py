@@ -0,0 +1,93 @@
+import calendar
+import openpyxl # type: ignore
+
+from instrumentation import instrumentation
+from kernels import top_items
+from play_store import day_to_date
+
+MAX_SHEET_ROWS = 1048576
+PROGRESS_INTERVAL = 65536
+SUMMARY_TOP_ITEMS = 100
+
+PLAY_COLUMNS = ("Date", "Hour", "Song", "Artist", "Minutes played", "Platform", "IP address", "Reason start", "Reason end")
+
+def iter_play_rows(store, progress=None):
+    tracks = store.tracks.values
+    artists = store.artists.values
+    platforms = store.platforms.values
+    reasons = store.reasons.values
+    ip_addresses = store.ip_addresses.values
+    rows = len(store)
+    for index in range(rows):
+        if progress is not None and index % PROGRESS_INTERVAL == 0:
+            progress(index / rows)
+        yield (
+            store.date_string(index),
+            store.time_string(index),
+            tracks[store.track[index]],
+            artists[store.artist[index]],
+            round(store.ms_played[index] / 1000 / 60, 2),
+            platforms[store.platform[index]],
+            ip_addresses[store.ip_address[index]],
+            reasons[store.reason_start[index]],
+            reasons[store.reason_end[index]],
+        )
+
+def write_rows(workbook, title, header, rows, max_rows=MAX_SHEET_ROWS):
+    # Continue on a new sheet once a sheet reaches Excel's row limit.
+    sheet = workbook.create_sheet(title)
+    sheet.append(header)
+    sheet_rows = 1
+    sheets = 1
+    for row in rows:
+        if sheet_rows == max_rows:
+            sheets += 1
+            sheet = workbook.create_sheet(f"{title} {sheets}")
+            sheet.append(header)
+            sheet_rows = 1
+        sheet.append(row)
+        sheet_rows += 1
+    return sheets
+
+def ranked_rows(counter, top=SUMMARY_TOP_ITEMS):
+    for rank, (item, count) in enumerate(top_items(counter.items(), top), start=1):
+        yield rank, "Unknown" if item is None else item, count
+
+def write_summary_sheets(workbook, results):
+    plays = results["plays"]
+    total_ms = results["total_ms"]
+    first, last = results["first_last"]
+    write_rows(workbook, "Overview", ("Statistic", "Value"), [
+        ("Songs listened", plays),
+        ("Hours listened", round(total_ms / 1000 / 60 / 60, 2)),
+        ("Average minutes per song", round(total_ms / plays / 1000 / 60, 2) if plays else 0),
+        ("First play", first["ts"] if first else None),
+        ("Last play", last["ts"] if last else None),
+    ])
+    write_rows(workbook, "Top Songs", ("Rank", "Song", "Plays"), ranked_rows(results["tracks"]))
+    write_rows(workbook, "Top Artists", ("Rank", "Artist", "Plays"), ranked_rows(results["artists"]))
+    write_rows(workbook, "Most Skipped", ("Rank", "Song", "Skips"), ranked_rows(results["skipped_tracks"]))
+    write_rows(workbook, "Devices", ("Rank", "Platform", "Plays"), ranked_rows(results["platforms"]))
+    write_rows(workbook, "Yearly", ("Year", "Plays"), sorted(results["plays_per_year"].items()))
+    write_rows(workbook, "Monthly", ("Month", "Plays", "Hours"),
+               ((f"{month // 100}-{month % 100:02d}", plays, round(results["ms_per_month"][month] / 1000 / 60 / 60, 2))
+                for month, plays in sorted(results["plays_per_month"].items())))
+    write_rows(workbook, "Daily", ("Date", "Plays"),
+               ((day_to_date(day).isoformat(), count) for day, count in sorted(results["plays_per_day"].items())))
+    write_rows(workbook, "Weekday Playtime", ("Weekday", "Hours"),
+               ((calendar.day_name[weekday], round(total_ms / 1000 / 60 / 60, 2))
+                for weekday, total_ms in sorted(results["ms_per_weekday"].items())))
+    write_rows(workbook, "Playback Reasons", ("Type", "Reason", "Count"),
+               [("Start", reason, count) for reason, count in results["reason_start"].items()] +
+               [("End", reason, count) for reason, count in results["reason_end"].items()])
+
+def export_plays(store, results, excel_file_path, title="Spotify Statistics", progress=None):
+    # Write-only workbooks stream rows to disk, memory stays flat as the history grows.
+    workbook = openpyxl.Workbook(write_only=True)
+    with instrumentation.part("play sheets"):
+        sheets = write_rows(workbook, title, PLAY_COLUMNS, iter_play_rows(store, progress))
+    with instrumentation.part("summary sheets"):
+        write_summary_sheets(workbook, results)
+    with instrumentation.part("save workbook"):
+        workbook.save(excel_file_path)
+    return sheets
@@ -0,0 +1,240 @@
+import os
+import json
+
+from itertools import islice
+from instrumentation import instrumentation
+from play_store import PlayStore
+
+try:
+    import orjson # type: ignore
+except ImportError:
+    orjson = None
+
+CHUNK_SIZE = 1 << 16
+BATCH_SIZE = 65536
+NDJSON_BATCH_LINES = 1024
+WHITESPACE = ' \t\n\r'
+HISTORY_EXTENSIONS = (".json", ".ndjson")
+
+def loads(text):
+    # orjson is several times faster than the standard decoder when it is installed.
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+def last_value_end(buffer, start):
+    # End of the last object in the buffer that is followed by a comma, and the position of that comma.
+    end = len(buffer)
+    while True:
+        comma = buffer.rfind(',', start, end)
+        if comma < 0:
+            return None, None
+        before = comma
+        while before > start and buffer[before - 1] in WHITESPACE:
+            before -= 1
+        if before > start and buffer[before - 1] == '}':
+            return before, comma
+        end = comma
+
+def iter_json_array(file, chunk_size=CHUNK_SIZE, state='start'):
+    # state 'separator' resumes an array right after one of its values, 'first' right after its '['.
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    batch = True
+
+    while True:
+        while True:
+            while pos < len(buffer) and buffer[pos] in WHITESPACE:
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            buffer, pos = file.read(chunk_size), 0
+            eof = not buffer
+            batch = True
+
+        if state == 'end':
+            if pos < len(buffer):
+                raise json.JSONDecodeError("Extra data", buffer, pos)
+            return
+        if pos >= len(buffer):
+            raise json.JSONDecodeError("Unexpected end of array", buffer, pos)
+
+        char = buffer[pos]
+        if state == 'start':
+            if char != '[':
+                raise json.JSONDecodeError("Expecting '['", buffer, pos)
+            pos += 1
+            state = 'first'
+        elif state == 'separator' or (state == 'first' and char == ']'):
+            if char == ']':
+                pos += 1
+                state = 'end'
+            elif char == ',':
+                pos += 1
+                state = 'value'
+            else:
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+        else:
+            end, comma = last_value_end(buffer, pos) if batch else (None, None)
+            if end is not None:
+                # The complete plays in the buffer are decoded by one call instead of one call per play.
+                # A '},' inside a string can end the slice early, then it is not valid JSON and plays are decoded one by one.
+                try:
+                    values = loads('[' + buffer[pos:end] + ']')
+                except json.JSONDecodeError:
+                    batch = False
+                else:
+                    yield from values
+                    pos = comma + 1
+                    state = 'value'
+                    continue
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    if end < len(buffer) or eof:
+                        break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                # The value may continue past the end of the buffer, read more and retry.
+                chunk = file.read(chunk_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                batch = True
+            pos = end
+            state = 'separator'
+            yield value
+
+def iter_ndjson(file, batch_lines=NDJSON_BATCH_LINES):
+    while True:
+        lines = list(islice(file, batch_lines))
+        if not lines:
+            return
+        plays = [line for line in lines if not line.isspace()]
+        if plays:
+            yield from loads('[' + ','.join(plays) + ']')
+
+def detect_format(file_path):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                return "json"
+            stripped = chunk.lstrip(WHITESPACE)
+            if stripped:
+                return "ndjson" if stripped[0] == "{" else "json"
+
+def read_plays(file, file_format):
+    if file_format == "ndjson":
+        return iter_ndjson(file)
+    return iter_json_array(file)
+
+def iter_plays(file_path, file_format=None):
+    file_format = file_format or detect_format(file_path)
+    with open(file_path, 'r', encoding='utf-8') as file:
+        yield from read_plays(file, file_format)
+
+def history_files(folder):
+    # The files of an export folder, e.g. Streaming_History_Audio_*.json, in name order.
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if name.endswith(HISTORY_EXTENSIONS) and os.path.isfile(os.path.join(folder, name)))
+
+def iter_batches(records, batch_size=BATCH_SIZE):
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def split_ndjson(file_path, parts):
+    # Byte ranges aligned on line starts, each one can be read independently.
+    size = os.path.getsize(file_path)
+    offsets = [0]
+    with open(file_path, 'rb') as file:
+        for part in range(1, parts):
+            position = max(size * part // parts, offsets[-1])
+            if position >= size:
+                break
+            file.seek(position)
+            if position > 0:
+                file.seek(position - 1)
+                if file.read(1) != b"\n":
+                    file.readline()
+            offsets.append(file.tell())
+    offsets.append(size)
+    return [(start, end) for start, end in zip(offsets, offsets[1:]) if start < end]
+
+def iter_ndjson_range(file_path, start, end, batch_lines=NDJSON_BATCH_LINES):
+    # The lines of one range from split_ndjson, decoded a batch of lines at a time like iter_ndjson.
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        position = start
+        while position < end:
+            lines = []
+            while position < end and len(lines) < batch_lines:
+                line = file.readline()
+                if not line:
+                    position = end
+                    break
+                position += len(line)
+                if not line.isspace():
+                    lines.append(line)
+            if lines:
+                yield from loads(b'[' + b','.join(lines) + b']')
+
+def ingest_records(records, store=None, aggregates=None, cache_writer=None, batch_size=BATCH_SIZE, keep_rows=True, progress=None,
+                   skip_podcasts=False):
+    # Feeds fixed-size batches to the aggregates and the cache, without keep_rows memory stays bounded by one batch.
+    # Decoded plays only live for one batch, the store keeps just the fields it uses.
+    store = store if store is not None else PlayStore(skip_podcasts)
+    # Without the rows, the lookup tables are only needed for the current batch unless the cache or a statistic keeps codes.
+    # Counters and sketches hold the values themselves, so memory does not grow with the number of distinct songs.
+    clear_tables = not keep_rows and cache_writer is None and (aggregates is None or not aggregates.keeps_codes())
+    rows = 0
+    batches = iter_batches(records, batch_size)
+    while True:
+        # Reading the next batch is where the JSON is decoded.
+        with instrumentation.part("decode"):
+            batch = next(batches, None)
+        if batch is None:
+            break
+        start = len(store)
+        with instrumentation.part("build columns"):
+            store.extend(batch)
+        if aggregates is not None:
+            aggregates.consume(store, start, len(store))
+        if cache_writer is not None:
+            with instrumentation.part("cache write"):
+                cache_writer.append(store, start)
+        if not keep_rows:
+            store.clear_rows(clear_tables)
+        rows += len(batch)
+        if progress is not None:
+            progress(rows)
+    return store
+
+def ingest_file(file_path, aggregates=None, play_cache=None, batch_size=BATCH_SIZE, keep_rows=True, progress=None,
+                skip_podcasts=False):
+    # progress gets the fraction of the file read so far after each batch.
+    file_format = detect_format(file_path)
+    size = os.path.getsize(file_path)
+    cache_writer = play_cache.open_writer(file_path, skip_podcasts) if play_cache is not None else None
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            # The text layer reads ahead, the position of the bytes underneath is close enough for progress.
+            batch_progress = (lambda rows: progress(min(file.buffer.tell() / size, 1.0))) if progress and size else None
+            store = ingest_records(read_plays(file, file_format), aggregates=aggregates, cache_writer=cache_writer,
+                                   batch_size=batch_size, keep_rows=keep_rows, progress=batch_progress,
+                                   skip_podcasts=skip_podcasts)
+    except BaseException:
+        if cache_writer is not None:
+            cache_writer.abort()
+        raise
+    if cache_writer is not None:
+        try:
+            with instrumentation.part("cache write"):
+                cache_writer.commit(store)
+        except OSError:
+            cache_writer.abort()
+    return store
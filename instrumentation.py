@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import platform
+import threading
+import tracemalloc
+import kernels
+
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+MAX_PHASES = 500
+TOP_ALLOCATIONS = 10
+# Set to a folder to start in capture mode, e.g. to reproduce a slow load for a bug report.
+CAPTURE_ENV = "SPOTIFY_ANALYZER_PROFILE"
+
+def reset_peak_memory():
+    # On Linux writing 5 to clear_refs resets the resident high-water mark (VmHWM) of the process.
+    try:
+        with open("/proc/self/clear_refs", 'w') as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        return False
+    return True
+
+def resident_peak_memory():
+    try:
+        with open("/proc/self/status", encoding='ascii') as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def process_peak_memory():
+    # High-water mark of the whole process, ru_maxrss is in kilobytes except on macOS.
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def environment():
+    # Timings are only comparable between runs on the same machine, Python and backend.
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "backend": kernels.backend,
+    }
+
+def file_slug(name):
+    return "".join(char if char.isalnum() else "_" for char in name).strip("_")[:60] or "phase"
+
+class Phase:
+    def __init__(self, name, depth, rows=None):
+        self.name = name
+        self.depth = depth
+        self.rows = rows
+        self.started = datetime.now()
+        self.thread = threading.current_thread().name
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_memory = None
+        self.memory_source = None
+        # Steps inside the phase, e.g. decode or one statistic: name -> [wall, cpu, calls], summed over batches.
+        self.parts = {}
+        self.profile_path = None
+        self.top_allocations = None
+
+    def add_part(self, name, wall, cpu):
+        part = self.parts.get(name)
+        if part is None:
+            self.parts[name] = [wall, cpu, 1]
+        else:
+            part[0] += wall
+            part[1] += cpu
+            part[2] += 1
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "depth": self.depth,
+            "started": self.started.isoformat(timespec="milliseconds"),
+            "thread": self.thread,
+            "wall_seconds": self.wall,
+            "cpu_seconds": self.cpu,
+            "rows": self.rows,
+            "peak_memory_bytes": self.peak_memory,
+            "memory_source": self.memory_source,
+            "parts": [{"name": name, "wall_seconds": wall, "cpu_seconds": cpu, "calls": calls}
+                      for name, (wall, cpu, calls) in self.parts.items()],
+            "profile": self.profile_path,
+            "top_allocations": self.top_allocations,
+        }
+
+    def describe(self):
+        text = f"{'  ' * self.depth}{self.name}: {self.wall:.3f} s wall, {self.cpu:.3f} s CPU"
+        if self.rows is not None:
+            text += f", {self.rows} rows"
+            if self.wall > 0:
+                text += f" ({self.rows / self.wall:,.0f} rows/s)"
+        if self.peak_memory is not None:
+            text += f", peak {self.peak_memory / 1024 / 1024:.1f} MB ({self.memory_source})"
+        text += "\n"
+        for name, (wall, cpu, calls) in sorted(self.parts.items(), key=lambda x: x[1][0], reverse=True):
+            text += f"{'  ' * (self.depth + 2)}{name}: {wall:.3f} s wall, {cpu:.3f} s CPU, {calls} calls\n"
+        if self.profile_path:
+            text += f"{'  ' * (self.depth + 2)}profile: {self.profile_path}\n"
+        return text
+
+class Instrumentation:
+    # Records wall time, CPU time of the running thread, rows and peak memory of each phase.
+    # CPU time of worker processes, e.g. when a folder is analyzed in parallel, is not included.
+    def __init__(self, limit=MAX_PHASES):
+        self.phases = deque(maxlen=limit)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.capture_folder = None
+        # Phases open in any thread, the resident high-water mark is only reset when none is.
+        self.open_phases = 0
+
+    def stack(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    @contextmanager
+    def phase(self, name, rows=None):
+        # Phases nest, the caller may set rows on the yielded phase once they are known.
+        stack = self.stack()
+        record = Phase(name, len(stack), rows)
+        capture_folder = self.capture_folder
+        profiler = None
+        if capture_folder is not None and not stack:
+            # Only outermost phases are profiled, a profiler cannot be nested in the same thread.
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                profiler = None
+        tracing = tracemalloc.is_tracing()
+        if not stack and tracing:
+            tracemalloc.reset_peak()
+        with self.lock:
+            # A reset while another thread's phase runs would lower the peak that phase reports.
+            resident = not tracing and (self.open_phases > 0 or reset_peak_memory())
+            self.open_phases += 1
+        stack.append(record)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield record
+        finally:
+            record.wall = time.perf_counter() - wall
+            record.cpu = time.thread_time() - cpu
+            stack.pop()
+            with self.lock:
+                self.open_phases -= 1
+            if profiler is not None:
+                profiler.disable()
+                record.profile_path = self.save_profile(profiler, record, capture_folder)
+            if tracemalloc.is_tracing():
+                record.peak_memory = tracemalloc.get_traced_memory()[1]
+                record.memory_source = "traced since outer phase"
+                if profiler is not None:
+                    record.top_allocations = self.top_allocations()
+            elif resident:
+                # Covers this phase, and whatever other phase was already running when it started.
+                record.peak_memory = resident_peak_memory()
+                record.memory_source = "resident since outer phase"
+            with self.lock:
+                self.phases.append(record)
+
+    @contextmanager
+    def part(self, name):
+        # Adds the time of a step to the innermost phase of this thread, nothing is recorded outside a phase.
+        stack = self.stack()
+        if not stack:
+            yield
+            return
+        record = stack[-1]
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            record.add_part(name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+    def start_capture(self, folder):
+        # Opt-in, cProfile and tracemalloc slow everything down noticeably.
+        os.makedirs(folder, exist_ok=True)
+        self.capture_folder = folder
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop_capture(self):
+        self.capture_folder = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def save_profile(self, profiler, record, folder):
+        path = os.path.join(folder, f"{record.started:%Y%m%d-%H%M%S-%f}-{file_slug(record.name)}.prof")
+        try:
+            profiler.dump_stats(path)
+        except OSError:
+            return None
+        return path
+
+    def top_allocations(self):
+        statistics = tracemalloc.take_snapshot().statistics("lineno")[:TOP_ALLOCATIONS]
+        return [{"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "bytes": stat.size,
+                 "blocks": stat.count} for stat in statistics]
+
+    def records(self):
+        with self.lock:
+            return list(self.phases)
+
+    def clear(self):
+        with self.lock:
+            self.phases.clear()
+
+    def as_dict(self):
+        return {
+            **environment(),
+            "capture_folder": self.capture_folder,
+            "process_peak_memory_bytes": process_peak_memory(),
+            "phases": [record.as_dict() for record in self.records()],
+        }
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as output:
+            json.dump(self.as_dict(), output, ensure_ascii=False, indent=2)
+        return path
+
+    def report(self):
+        records = self.records()
+        if not records:
+            return "No phases recorded yet. Load a file, run an analysis or export to Excel.\n"
+        # Nested phases finish first, they are listed under the phase that contains them.
+        ordered = sorted(records, key=lambda record: (record.started, record.depth))
+        text = "".join(record.describe() for record in ordered)
+        peak = process_peak_memory()
+        if peak is not None and any(record.peak_memory is None for record in records):
+            # Without a per-phase measurement only the high-water mark of the process is known, it is not shown per phase.
+            text += f"Process peak memory (high-water mark, not per phase): {peak / 1024 / 1024:.1f} MB\n"
+        return text
+
+instrumentation = Instrumentation()
+
+if os.environ.get(CAPTURE_ENV):
+    instrumentation.start_capture(os.environ[CAPTURE_ENV])
@@ -0,0 +1,104 @@
+import queue
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_INTERVAL_MS = 50
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    def __init__(self, scheduler, panel, function, on_done, on_error, on_progress):
+        self.scheduler = scheduler
+        self.panel = panel
+        self.function = function
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.cancelled = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    def progress(self, fraction, message=""):
+        # Called from the worker, doubles as a cancellation point.
+        self.check_cancelled()
+        if self.on_progress is not None:
+            self.scheduler.events.put(("progress", self, (fraction, message)))
+
+class JobScheduler:
+    def __init__(self, root, max_workers=2):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.events = queue.Queue()
+        self.current = {}
+        self.polling = False
+
+    def submit(self, panel, function, on_done=None, on_error=None, on_progress=None):
+        # A newer job for the same panel replaces the pending or running one.
+        self.cancel(panel)
+        job = Job(self, panel, function, on_done, on_error, on_progress)
+        self.current[panel] = job
+        job.future = self.executor.submit(self.run, job)
+        if not self.polling:
+            self.polling = True
+            self.root.after(POLL_INTERVAL_MS, self.poll)
+        return job
+
+    def run(self, job):
+        try:
+            job.check_cancelled()
+            result = job.function(job)
+        except JobCancelled:
+            return
+        except Exception as e:
+            self.events.put(("error", job, e))
+            return
+        self.events.put(("done", job, result))
+
+    def poll(self):
+        # A failing callback is reported by Tk, polling goes on so later jobs are still delivered.
+        try:
+            while True:
+                try:
+                    kind, job, value = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                if job.cancelled.is_set() or self.current.get(job.panel) is not job:
+                    continue
+                if kind == "progress":
+                    job.on_progress(*value)
+                    continue
+                del self.current[job.panel]
+                callback = job.on_done if kind == "done" else job.on_error
+                if callback is not None:
+                    callback(value)
+        finally:
+            if self.current or not self.events.empty():
+                self.root.after(POLL_INTERVAL_MS, self.poll)
+            else:
+                self.polling = False
+
+    def cancel(self, panel):
+        job = self.current.pop(panel, None)
+        if job is not None:
+            job.cancel()
+        return job is not None
+
+    def cancel_all(self):
+        cancelled = False
+        for panel in list(self.current):
+            cancelled = self.cancel(panel) or cancelled
+        return cancelled
+
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False, cancel_futures=True)
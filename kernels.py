@@ -0,0 +1,147 @@
+import os
+
+from heapq import nlargest
+from collections import Counter
+
+try:
+    import numpy as np # type: ignore
+except ImportError:
+    np = None
+
+BACKENDS = ("python", "numpy")
+# Packed group keys must fit in a signed 64-bit integer.
+MAX_KEY_BITS = 62
+
+backend = os.environ.get("SPOTIFY_ANALYZER_BACKEND") or ("numpy" if np is not None else "python")
+
+def use_numpy(selected=None):
+    return (selected or backend) == "numpy" and np is not None
+
+def column_sum(values, selected=None):
+    if use_numpy(selected):
+        return int(np.asarray(values, dtype=np.int64).sum())
+    return sum(values)
+
+def histogram(values, bins=10, selected=None):
+    # Same bins and edge rules as numpy.histogram: equal widths between min and max, last bin closed.
+    if use_numpy(selected):
+        counts, edges = np.histogram(np.asarray(values), bins=bins)
+        return counts.tolist(), edges.tolist()
+
+    if len(values):
+        low, high = min(values), max(values)
+    else:
+        low, high = 0, 1
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    step = (float(high) - float(low)) / bins
+    edges = [index * step + low for index in range(bins)] + [float(high)]
+    counts = [0] * bins
+    span = high - low
+    for value in values:
+        index = int((float(value) - low) / span * bins)
+        if index == bins:
+            index -= 1
+        if value < edges[index]:
+            index -= 1
+        elif index != bins - 1 and value >= edges[index + 1]:
+            index += 1
+        counts[index] += 1
+    return counts, edges
+
+def top_items(items, k, selected=None):
+    # The k (item, count) pairs with the highest counts, ties keep their original order like heapq.nlargest.
+    items = list(items)
+    if not use_numpy(selected) or k >= len(items):
+        return nlargest(k, items, key=lambda x: x[1])
+
+    counts = np.array([count for _, count in items])
+    threshold = counts[np.argpartition(counts, len(counts) - k)[len(counts) - k]]
+    greater = np.flatnonzero(counts > threshold)
+    equal = np.flatnonzero(counts == threshold)[:k - len(greater)]
+    top = np.concatenate((greater, equal))
+    top = top[np.lexsort((top, -counts[top]))]
+    return [items[index] for index in top.tolist()]
+
+def group_totals(keys, values=(), flags=(), selected=None):
+    # Groups rows by their key columns: key tuple -> [rows, sum of each value column, set rows of each flag].
+    # flags are (bitmap, start, stop) ranges lined up with the key columns.
+    if use_numpy(selected):
+        totals = group_totals_numpy(keys, values, flags)
+        if totals is not None:
+            return totals
+
+    rows = list(zip(*keys))
+    width = 1 + len(values) + len(flags)
+    totals = {key: [count] + [0] * (width - 1) for key, count in Counter(rows).items()}
+    for position, column in enumerate(values, start=1):
+        for key, value in zip(rows, column):
+            totals[key][position] += value
+    for position, (bitmap, start, stop) in enumerate(flags, start=1 + len(values)):
+        for index in bitmap.set_indices(start, stop):
+            totals[rows[index - start]][position] += 1
+    return totals
+
+def group_totals_numpy(keys, values, flags):
+    columns = [np.asarray(column, dtype=np.int64) for column in keys]
+    if not len(columns[0]):
+        return {}
+
+    # Key columns are packed into one integer per row, np.unique then groups them in a single sort.
+    lows = [int(column.min()) for column in columns]
+    widths = [(int(column.max()) - low).bit_length() for column, low in zip(columns, lows)]
+    if sum(widths) > MAX_KEY_BITS:
+        return None
+    packed = np.zeros(len(columns[0]), dtype=np.int64)
+    shifts = []
+    shift = 0
+    for column, low, width in zip(columns, lows, widths):
+        packed |= (column - low) << shift
+        shifts.append(shift)
+        shift += width
+    unique, inverse, counts = np.unique(packed, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+
+    # Integer sums per group with reduceat over the rows sorted by group, exact unlike float bincount weights.
+    order = np.argsort(inverse, kind='stable')
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sums = [np.add.reduceat(np.asarray(column, dtype=np.int64)[order], starts) for column in values]
+    for bitmap, start, stop in flags:
+        first_byte = start >> 3
+        chunk = np.frombuffer(bitmap.bits, dtype=np.uint8, count=((stop + 7) >> 3) - first_byte, offset=first_byte)
+        bits = np.unpackbits(chunk, bitorder='little')[start & 7:(start & 7) + stop - start]
+        sums.append(np.bincount(inverse, weights=bits, minlength=len(unique)).astype(np.int64))
+
+    key_columns = [(((unique >> shift) & ((1 << width) - 1)) + low).tolist()
+                   for shift, width, low in zip(shifts, widths, lows)]
+    return {key: [count, *measures] for key, count, *measures
+            in zip(zip(*key_columns), counts.tolist(), *(column.tolist() for column in sums))}
+
+def session_breaks(ts, ms_played, gap_ms, previous_end=None):
+    # Offsets of the plays that start a new session, and the latest play end seen, both in epoch milliseconds.
+    # A play starts ms_played before its ts, which Spotify records when the play ends.
+    if not len(ts):
+        return [], previous_end
+    if use_numpy():
+        finish = np.asarray(ts, dtype=np.int64) * 1000
+        start = finish - np.asarray(ms_played, dtype=np.int64)
+        running = np.maximum.accumulate(finish)
+        previous = np.empty_like(finish)
+        previous[1:] = running[:-1]
+        if previous_end is None:
+            previous[0] = start[0] - gap_ms - 1
+        else:
+            previous[0] = previous_end
+            previous[1:] = np.maximum(previous[1:], previous_end)
+        end = int(running[-1]) if previous_end is None else max(int(running[-1]), previous_end)
+        return np.flatnonzero(start - previous > gap_ms).tolist(), end
+
+    breaks = []
+    end = previous_end
+    for offset, (ts_value, ms) in enumerate(zip(ts, ms_played)):
+        finish = ts_value * 1000
+        if end is None or finish - ms - end > gap_ms:
+            breaks.append(offset)
+        if end is None or finish > end:
+            end = finish
+    return breaks, end
@@ -1,34 +1,123 @@
 import json
 import os
+import heapq
 import argparse
+import tempfile
 
-def merge_and_sort_json(input_folder, output_file):
+from itertools import islice
+from ingest import HISTORY_EXTENSIONS, iter_ndjson, iter_plays
+
+RUN_SIZE = 100000
+
+def merge_and_sort_json(input_folder, output_file, ndjson=False):
     all_data = []
 
-    json_files = [f for f in os.listdir(input_folder) if f.endswith('.json')]
+    json_files = [f for f in os.listdir(input_folder) if f.endswith(HISTORY_EXTENSIONS)]
 
     for file_name in json_files:
-        with open(os.path.join(input_folder, file_name), 'r', encoding='utf-8') as file:
-            try:
-                data = json.load(file)
-                all_data.extend(data)
-            except json.JSONDecodeError:
-                print(f"Error decoding JSON in file: {file_name}")
+        # JSON arrays and NDJSON files, a file that does not decode is left out whole.
+        try:
+            data = list(iter_plays(os.path.join(input_folder, file_name)))
+            all_data.extend(data)
+        except json.JSONDecodeError:
+            print(f"Error decoding JSON in file: {file_name}")
 
     all_data.sort(key=lambda x: x.get('ts', ''))
 
     with open(output_file, 'w', encoding='utf-8') as output:
-        json.dump(all_data, output, ensure_ascii=False, indent=2)
+        if ndjson:
+            write_ndjson(all_data, output)
+        else:
+            json.dump(all_data, output, ensure_ascii=False, indent=2)
+
+def sort_key(record):
+    return record.get('ts', '')
+
+def scan_json_file(file_path):
+    is_sorted = True
+    previous = None
+    for record in iter_plays(file_path):
+        key = sort_key(record)
+        if previous is not None and key < previous:
+            is_sorted = False
+        previous = key
+    return is_sorted
+
+def iter_sorted_json_file(file_path):
+    yield from iter_plays(file_path)
+
+def write_sorted_runs(file_path, run_size, temp_dir):
+    run_paths = []
+    records = iter_plays(file_path)
+    while True:
+        run = list(islice(records, run_size))
+        if not run:
+            break
+        run.sort(key=sort_key)
+        run_path = os.path.join(temp_dir, f"run_{len(run_paths)}_{os.path.basename(file_path)}.ndjson")
+        with open(run_path, 'w', encoding='utf-8') as output:
+            write_ndjson(run, output)
+        run_paths.append(run_path)
+    return run_paths
+
+def iter_run(run_path):
+    with open(run_path, 'r', encoding='utf-8') as file:
+        yield from iter_ndjson(file)
+
+def write_json_array(records, output):
+    # Same layout as json.dump(..., indent=2), one record at a time.
+    separator = '[\n  '
+    for record in records:
+        output.write(separator)
+        output.write(json.dumps(record, ensure_ascii=False, indent=2).replace('\n', '\n  '))
+        separator = ',\n  '
+    output.write('[]' if separator == '[\n  ' else '\n]')
+
+def write_ndjson(records, output):
+    # One play per line, later loads can split the file by byte offset.
+    for record in records:
+        output.write(json.dumps(record, ensure_ascii=False))
+        output.write('\n')
+
+def merge_and_sort_json_streaming(input_folder, output_file, run_size=RUN_SIZE, ndjson=False):
+    json_files = [f for f in os.listdir(input_folder) if f.endswith(HISTORY_EXTENSIONS)]
+
+    with tempfile.TemporaryDirectory(prefix='spotify_merge_') as temp_dir:
+        streams = []
+        for file_name in json_files:
+            file_path = os.path.join(input_folder, file_name)
+            try:
+                if scan_json_file(file_path):
+                    streams.append(iter_sorted_json_file(file_path))
+                else:
+                    runs = write_sorted_runs(file_path, run_size, temp_dir)
+                    streams.append(heapq.merge(*[iter_run(run) for run in runs], key=sort_key))
+            except json.JSONDecodeError:
+                print(f"Error decoding JSON in file: {file_name}")
+
+        # heapq.merge is stable, ties keep the file order used by merge_and_sort_json.
+        with open(output_file, 'w', encoding='utf-8') as output:
+            merged = heapq.merge(*streams, key=sort_key)
+            if ndjson:
+                write_ndjson(merged, output)
+            else:
+                write_json_array(merged, output)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Merge and sort Spotify JSON files.')
-    parser.add_argument('input_folder', type=str, help='Input folder containing JSON files')
+    parser.add_argument('input_folder', type=str, help='Input folder containing JSON or NDJSON files')
     parser.add_argument('output_file', type=str, help='Unified and sorted output file in JSON format')
+    parser.add_argument('--streaming', action='store_true', help='Merge files incrementally with bounded memory')
+    parser.add_argument('--run-size', type=int, default=RUN_SIZE, help='Records per sorted run for unsorted files in streaming mode')
+    parser.add_argument('--ndjson', action='store_true', help='Write one play per line instead of a JSON array')
 
     args = parser.parse_args()
 
     try:
-        merge_and_sort_json(args.input_folder, args.output_file)
+        if args.streaming:
+            merge_and_sort_json_streaming(args.input_folder, args.output_file, args.run_size, args.ndjson)
+        else:
+            merge_and_sort_json(args.input_folder, args.output_file, args.ndjson)
         print(f"Merge and sort successful. Result saved to {args.output_file}")
     except Exception as e:
         print(f"Error: {e}")
@@ -0,0 +1,308 @@
+import os
+import io
+import json
+import time
+import shutil
+import hashlib
+import argparse
+
+from ingest import detect_format, iter_batches, iter_json_array, iter_ndjson
+from play_store import ARRAY_COLUMNS, FLAG_FIELDS, TABLE_NAMES, Bitmap, PlayStore, StringTable
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "spotify_analyzer")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+SAMPLE_BLOCK_SIZE = 1 << 16
+SAMPLE_BLOCKS = 16
+HASH_BLOCK_SIZE = 1 << 20
+WHITESPACE = b" \t\n\r"
+
+def sample_hash(file_path, size):
+    # Head, tail and evenly spaced blocks, cheap enough to check on every open.
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as file:
+        offsets = {0, max(0, size - SAMPLE_BLOCK_SIZE)}
+        offsets.update(size * i // SAMPLE_BLOCKS for i in range(1, SAMPLE_BLOCKS))
+        for offset in sorted(offsets):
+            file.seek(offset)
+            digest.update(file.read(SAMPLE_BLOCK_SIZE))
+    return digest.hexdigest()
+
+def prefix_hash(file_path, length):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as file:
+        remaining = length
+        while remaining > 0:
+            block = file.read(min(HASH_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+def find_data_end(file_path, size, file_format="json"):
+    # Offset just past the last play, new plays appended to the source start there.
+    if file_format == "ndjson":
+        return size, False
+    with open(file_path, 'rb') as file:
+        position = size
+        seen_bracket = False
+        while position > 0:
+            start = max(0, position - SAMPLE_BLOCK_SIZE)
+            file.seek(start)
+            block = file.read(position - start)
+            for index in range(len(block) - 1, -1, -1):
+                byte = block[index:index + 1]
+                if byte in WHITESPACE:
+                    continue
+                if byte == b"]" and not seen_bracket:
+                    seen_bracket = True
+                    continue
+                if not seen_bracket:
+                    return None, False
+                return start + index + 1, byte == b"["
+            position = start
+    return None, False
+
+class PlayCache:
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or os.environ.get("SPOTIFY_ANALYZER_CACHE", DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+
+    def entry_dir(self, file_path, skip_podcasts=False):
+        # A history loaded without its podcast plays is a separate entry.
+        name = os.path.abspath(file_path) + ("\0skip_podcasts" if skip_podcasts else "")
+        key = hashlib.blake2b(name.encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, key)
+
+    def read_meta(self, entry_dir):
+        try:
+            with open(os.path.join(entry_dir, "meta.json"), 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("version") == CACHE_VERSION else None
+
+    def write_meta(self, entry_dir, meta):
+        meta_path = os.path.join(entry_dir, "meta.json")
+        with open(meta_path + ".tmp", 'w', encoding='utf-8') as file:
+            json.dump(meta, file, ensure_ascii=False)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def load(self, file_path, skip_podcasts=False):
+        entry_dir = self.entry_dir(file_path, skip_podcasts)
+        meta = self.read_meta(entry_dir)
+        if meta is None or meta["path"] != os.path.abspath(file_path) or meta.get("skip_podcasts", False) != skip_podcasts:
+            return None
+
+        stat = os.stat(file_path)
+        unchanged = stat.st_size == meta["size"] and stat.st_mtime_ns == meta["mtime_ns"]
+        has_prefix = meta["data_end"] is not None and stat.st_size > meta["data_end"]
+        appended = False
+        try:
+            if unchanged and sample_hash(file_path, stat.st_size) == meta["sample_hash"]:
+                store = self.read_store(entry_dir, meta)
+            elif stat.st_size == meta["size"] and has_prefix and prefix_hash(file_path, meta["data_end"]) == meta["prefix_hash"]:
+                # Touched but not modified.
+                store = self.read_store(entry_dir, meta)
+                meta["mtime_ns"] = stat.st_mtime_ns
+            elif has_prefix and prefix_hash(file_path, meta["data_end"]) == meta["prefix_hash"]:
+                store = self.read_store(entry_dir, meta)
+                self.append_tail(file_path, store, meta)
+                appended = True
+            else:
+                return None
+        except (OSError, KeyError, ValueError):
+            # Missing or damaged column files, or a tail that does not parse, are a miss and the file is parsed again.
+            return None
+
+        try:
+            if appended:
+                # Only the new rows are written, after the committed ones. Replacing meta.json commits them,
+                # until then readers keep using the previous row count.
+                self.append_columns(entry_dir, store, meta["rows"])
+                self.update_meta(file_path, store, meta, stat)
+            meta["last_used"] = time.time()
+            self.write_meta(entry_dir, meta)
+        except OSError:
+            pass
+        return store
+
+    def read_store(self, entry_dir, meta):
+        store = PlayStore(meta.get("skip_podcasts", False))
+        rows = meta["rows"]
+        for name in ARRAY_COLUMNS + FLAG_FIELDS:
+            # Bytes past the committed rows are left by an interrupted append, they are ignored and overwritten by the next one.
+            expected = (rows + 7) >> 3 if name in FLAG_FIELDS else rows * getattr(store, name).itemsize
+            with open(os.path.join(entry_dir, f"{name}.bin"), 'rb') as file:
+                data = file.read(expected)
+            if len(data) != expected:
+                raise ValueError(f"Cache column {name} has {len(data)} bytes, {expected} expected.")
+            if name in FLAG_FIELDS:
+                bitmap = Bitmap.from_bytes(data, rows)
+                if rows % 8:
+                    # Bits of the last byte past the committed rows may also be left over.
+                    bitmap.bits[-1] &= (1 << (rows % 8)) - 1
+                setattr(store, name, bitmap)
+            else:
+                getattr(store, name).frombytes(data)
+        for name in TABLE_NAMES:
+            setattr(store, name, StringTable(meta["tables"][name]))
+        return store
+
+    def append_tail(self, file_path, store, meta):
+        with open(file_path, 'rb') as file:
+            file.seek(meta["data_end"])
+            tail = io.TextIOWrapper(file, encoding='utf-8')
+            if meta["format"] == "ndjson":
+                records = iter_ndjson(tail)
+            else:
+                records = iter_json_array(tail, state='first' if meta["empty"] else 'separator')
+            for batch in iter_batches(records):
+                store.extend(batch)
+
+    def write_columns(self, entry_dir, store, start_row, mode):
+        for name in ARRAY_COLUMNS:
+            with open(os.path.join(entry_dir, f"{name}.bin"), mode) as file:
+                getattr(store, name)[start_row:].tofile(file)
+
+    def append_columns(self, entry_dir, store, start_row):
+        # The rows from start_row are written in place after the committed ones, anything past them is cut off.
+        for name in ARRAY_COLUMNS:
+            column = getattr(store, name)
+            with open(os.path.join(entry_dir, f"{name}.bin"), 'r+b') as file:
+                file.seek(start_row * column.itemsize)
+                column[start_row:].tofile(file)
+                file.truncate()
+        for name in FLAG_FIELDS:
+            # The partly filled last byte is written again with the new bits.
+            with open(os.path.join(entry_dir, f"{name}.bin"), 'r+b') as file:
+                file.seek(start_row >> 3)
+                file.write(getattr(store, name).bits[start_row >> 3:])
+                file.truncate()
+
+    def write_bitmaps(self, entry_dir, bitmaps):
+        # Bitmaps are small, rewrite them whole rather than splicing partial bytes.
+        for name, bitmap in bitmaps.items():
+            with open(os.path.join(entry_dir, f"{name}.bin"), 'wb') as file:
+                file.write(bitmap.bits)
+
+    def update_meta(self, file_path, store, meta, stat, rows=None):
+        file_format = detect_format(file_path)
+        data_end, empty = find_data_end(file_path, stat.st_size, file_format)
+        meta.update({
+            "format": file_format,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sample_hash": sample_hash(file_path, stat.st_size),
+            "data_end": data_end,
+            "empty": empty,
+            "prefix_hash": prefix_hash(file_path, data_end) if data_end is not None else None,
+            "rows": len(store) if rows is None else rows,
+            "tables": {name: getattr(store, name).values for name in TABLE_NAMES},
+        })
+
+    def open_writer(self, file_path, skip_podcasts=False):
+        return CacheWriter(self, file_path, skip_podcasts)
+
+    def save(self, file_path, store):
+        writer = self.open_writer(file_path, store.skip_podcasts)
+        try:
+            writer.append(store)
+            writer.commit(store)
+        except BaseException:
+            writer.abort()
+            raise
+
+    def invalidate(self, file_path):
+        for skip_podcasts in (False, True):
+            shutil.rmtree(self.entry_dir(file_path, skip_podcasts), ignore_errors=True)
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".tmp"):
+                # Entries still being written by another load.
+                continue
+            entry_dir = os.path.join(self.cache_dir, name)
+            meta = self.read_meta(entry_dir)
+            size = sum(entry.stat().st_size for entry in os.scandir(entry_dir)) if os.path.isdir(entry_dir) else 0
+            entries.append((meta["last_used"] if meta else 0, size, entry_dir))
+        return entries
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        # Least recently used first, always keeping the newest entry.
+        for _, size, entry_dir in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+class CacheWriter:
+    # Builds a cache entry batch by batch while a history is being ingested.
+    def __init__(self, cache, file_path, skip_podcasts=False):
+        self.cache = cache
+        self.file_path = file_path
+        self.skip_podcasts = skip_podcasts
+        self.entry_dir = cache.entry_dir(file_path, skip_podcasts)
+        self.temp_dir = self.entry_dir + ".tmp"
+        self.stat = os.stat(file_path)
+        self.rows = 0
+        self.bitmaps = {name: Bitmap() for name in FLAG_FIELDS}
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        os.makedirs(self.temp_dir)
+
+    def append(self, store, start_row=0):
+        self.cache.write_columns(self.temp_dir, store, start_row, 'ab')
+        for name, bitmap in self.bitmaps.items():
+            column = getattr(store, name)
+            if start_row % 8 == 0:
+                bitmap.extend(Bitmap.from_bytes(column.bits[start_row >> 3:], len(store) - start_row))
+            else:
+                for index in range(start_row, len(store)):
+                    bitmap.append(column[index])
+        self.rows += len(store) - start_row
+
+    def commit(self, store):
+        # Creates the column files even when the history had no plays.
+        self.cache.write_columns(self.temp_dir, store, len(store), 'ab')
+        self.cache.write_bitmaps(self.temp_dir, self.bitmaps)
+        meta = {"version": CACHE_VERSION, "path": os.path.abspath(self.file_path), "skip_podcasts": self.skip_podcasts,
+                "last_used": time.time()}
+        self.cache.update_meta(self.file_path, store, meta, self.stat, self.rows)
+        self.cache.write_meta(self.temp_dir, meta)
+
+        shutil.rmtree(self.entry_dir, ignore_errors=True)
+        os.replace(self.temp_dir, self.entry_dir)
+        self.cache.evict()
+
+    def abort(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Manage the Spotify Analyzer play cache.')
+    parser.add_argument('--cache-dir', type=str, default=None, help='Cache folder (defaults to ~/.cache/spotify_analyzer)')
+    parser.add_argument('--invalidate', type=str, metavar='JSON_FILE', help='Drop the cache entry of a history file')
+    parser.add_argument('--clear', action='store_true', help='Drop every cache entry')
+    parser.add_argument('--max-bytes', type=int, default=DEFAULT_MAX_BYTES, help='Evict least recently used entries above this size')
+
+    args = parser.parse_args()
+    cache = PlayCache(args.cache_dir, args.max_bytes)
+
+    if args.clear:
+        cache.clear()
+        print(f"Cache cleared: {cache.cache_dir}")
+    elif args.invalidate:
+        cache.invalidate(args.invalidate)
+        print(f"Cache entry removed for {args.invalidate}")
+    else:
+        cache.evict()
+        entries = cache.entries()
+        print(f"{len(entries)} cache entries, {sum(size for _, size, _ in entries)} bytes in {cache.cache_dir}")
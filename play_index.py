@@ -0,0 +1,162 @@
+import threading
+
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+from play_store import ARRAY_COLUMNS, EPOCH_ORDINAL, FLAG_FIELDS, SECONDS_PER_DAY, TABLE_NAMES, Bitmap, PlayStore
+
+FILTER_COLUMNS = {
+    "platform": ("platform",),
+    "artist": ("artist",),
+    "reason": ("reason_start", "reason_end"),
+}
+
+class PlayFilter:
+    def __init__(self, start=None, end=None, platform=None, artist=None, reason=None):
+        # start and end are inclusive dates, attribute values match case-insensitive substrings.
+        self.start = start
+        self.end = end
+        self.platform = platform or None
+        self.artist = artist or None
+        self.reason = reason or None
+
+    @classmethod
+    def parse(cls, start="", end="", platform="", artist="", reason=""):
+        return cls(date.fromisoformat(start.strip()) if start.strip() else None,
+                   date.fromisoformat(end.strip()) if end.strip() else None,
+                   platform.strip(), artist.strip(), reason.strip())
+
+    def key(self):
+        return (self.start, self.end, self.platform, self.artist, self.reason)
+
+    def is_empty(self):
+        return not any(self.key())
+
+    def time_range(self):
+        start_ts = (self.start.toordinal() - EPOCH_ORDINAL) * SECONDS_PER_DAY if self.start else None
+        end_ts = (self.end.toordinal() - EPOCH_ORDINAL + 1) * SECONDS_PER_DAY - 1 if self.end else None
+        return start_ts, end_ts
+
+    def describe(self):
+        parts = []
+        if self.start or self.end:
+            parts.append(f"{self.start or '...'} to {self.end or '...'}")
+        for name in FILTER_COLUMNS:
+            value = getattr(self, name)
+            if value:
+                parts.append(f"{name}: {value}")
+        return ", ".join(parts) if parts else "no filter"
+
+class PlayIndex:
+    def __init__(self, store):
+        self.store = store
+        self.indexed_rows = 0
+        self.order = array('i')
+        self.sorted_ts = array('q')
+        self.postings = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        stop = len(self.store)
+        if self.indexed_rows == stop:
+            return
+        ts = self.store.ts
+        new_rows = sorted(range(self.indexed_rows, stop), key=ts.__getitem__)
+        if not self.sorted_ts or ts[new_rows[0]] >= self.sorted_ts[-1]:
+            # Appended plays are newer than everything indexed, the order only grows at the end.
+            self.order.extend(new_rows)
+            self.sorted_ts.extend(ts[row] for row in new_rows)
+        else:
+            self.order = array('i', sorted(range(stop), key=ts.__getitem__))
+            self.sorted_ts = array('q', (ts[row] for row in self.order))
+        for column, postings in self.postings.items():
+            codes = getattr(self.store, column)
+            for row in range(self.indexed_rows, stop):
+                postings.setdefault(codes[row], array('i')).append(row)
+        self.indexed_rows = stop
+
+    def posting_lists(self, column):
+        postings = self.postings.get(column)
+        if postings is None:
+            postings = {}
+            for row, code in enumerate(getattr(self.store, column)[:self.indexed_rows]):
+                postings.setdefault(code, array('i')).append(row)
+            self.postings[column] = postings
+        return postings
+
+    def range_rows(self, start_ts=None, end_ts=None):
+        low = 0 if start_ts is None else bisect_left(self.sorted_ts, start_ts)
+        high = len(self.sorted_ts) if end_ts is None else bisect_right(self.sorted_ts, end_ts)
+        return self.order[low:high]
+
+    def matching_codes(self, column, value):
+        needle = value.lower()
+        return {code for code, item in enumerate(self.store.table(column).values)
+                if item is not None and needle in item.lower()}
+
+    def select(self, play_filter):
+        # Built lazily on the first filter, background jobs may select concurrently.
+        with self.lock:
+            self.refresh()
+            return self.select_rows(play_filter)
+
+    def select_rows(self, play_filter):
+        start_ts, end_ts = play_filter.time_range()
+
+        # Candidate sets: the time range and one union of posting lists per attribute.
+        candidates = []
+        checks = []
+        if start_ts is not None or end_ts is not None:
+            candidates.append((len(self.range_rows(start_ts, end_ts)), "range", None))
+        for name, columns in FILTER_COLUMNS.items():
+            value = getattr(play_filter, name)
+            if not value:
+                continue
+            codes = {column: self.matching_codes(column, value) for column in columns}
+            size = sum(len(self.posting_lists(column).get(code, ())) for column in columns for code in codes[column])
+            candidates.append((size, name, codes))
+            checks.append(codes)
+
+        if not candidates:
+            return range(len(self.store))
+
+        # Start from the smallest set and check the other conditions row by row.
+        _, name, codes = min(candidates, key=lambda candidate: candidate[0])
+        if name == "range":
+            rows = sorted(self.range_rows(start_ts, end_ts))
+        else:
+            rows = sorted({row for column, column_codes in codes.items()
+                           for code in column_codes for row in self.posting_lists(column).get(code, ())})
+            if start_ts is not None or end_ts is not None:
+                ts = self.store.ts
+                rows = [row for row in rows if (start_ts is None or ts[row] >= start_ts) and (end_ts is None or ts[row] <= end_ts)]
+        for other in checks:
+            if other is codes:
+                continue
+            columns = [(getattr(self.store, column), column_codes) for column, column_codes in other.items()]
+            rows = [row for row in rows if any(column[row] in column_codes for column, column_codes in columns)]
+        return rows
+
+def take_rows(store, rows):
+    # A filtered view sharing the lookup tables of the source store.
+    view = PlayStore(store.skip_podcasts)
+    for name in ARRAY_COLUMNS:
+        column = getattr(store, name)
+        getattr(view, name).extend(column[row] for row in rows)
+    for name in FLAG_FIELDS:
+        column = getattr(store, name)
+        bitmap = Bitmap()
+        for row in rows:
+            bitmap.append(column[row])
+        setattr(view, name, bitmap)
+    for name in TABLE_NAMES:
+        setattr(view, name, getattr(store, name))
+    view.day_cache = store.day_cache
+    view.date_strings = store.date_strings
+    return view
+
+def filter_store(store, play_filter, index=None):
+    if play_filter is None or play_filter.is_empty():
+        return store
+    index = index or PlayIndex(store)
+    return take_rows(store, index.select(play_filter))
@@ -0,0 +1,286 @@
+import calendar
+
+from array import array
+from itertools import repeat
+from datetime import date, datetime
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+SECONDS_PER_DAY = 86400
+
+# Dictionary-encoded columns and the record field each one is read from.
+STRING_FIELDS = {
+    "track": "master_metadata_track_name",
+    "artist": "master_metadata_album_artist_name",
+    "platform": "platform",
+    "reason_start": "reason_start",
+    "reason_end": "reason_end",
+    "ip_address": "ip_addr_decrypted",
+}
+
+# Columns sharing one lookup table.
+STRING_TABLES = {
+    "track": "tracks",
+    "artist": "artists",
+    "platform": "platforms",
+    "reason_start": "reasons",
+    "reason_end": "reasons",
+    "ip_address": "ip_addresses",
+}
+
+FLAG_FIELDS = ("skipped", "shuffle")
+# A play is a podcast episode when either of these fields is set.
+EPISODE_FIELDS = ("episode_name", "spotify_episode_uri")
+
+ARRAY_COLUMNS = ("ms_played", "ts", "day", "track", "artist", "platform", "reason_start", "reason_end", "ip_address")
+TABLE_NAMES = ("tracks", "artists", "platforms", "reasons", "ip_addresses")
+BIT_DIGITS = bytes.maketrans(b"\x00\x01", b"01")
+
+# Every digit of a timestamp becomes 0, a batch in the fixed layout then equals the template repeated.
+TIMESTAMP_TEMPLATE = b"0000-00-00T00:00:00Z"
+TIMESTAMP_DIGITS = bytes.maketrans(b"123456789", b"000000000")
+ZERO = ord("0")
+DATE_ZEROS = ZERO * 11111111
+TIME_ZEROS = ZERO * (11 * 3600 + 11 * 60 + 11)
+
+def parse_timestamp(value, day_cache):
+    # Fixed "YYYY-MM-DDTHH:MM:SSZ" layout, the date part repeats across plays so its day number is cached.
+    if len(value) != 20 or value[10] != "T" or value[19] != "Z":
+        timestamp = datetime.strptime(value, TIMESTAMP_FORMAT)
+        seconds = calendar.timegm(timestamp.timetuple())
+        return seconds, seconds // SECONDS_PER_DAY
+    day = day_cache.get(value[:10])
+    if day is None:
+        day = date(int(value[0:4]), int(value[5:7]), int(value[8:10])).toordinal() - EPOCH_ORDINAL
+        day_cache[value[:10]] = day
+    seconds_of_day = int(value[11:13]) * 3600 + int(value[14:16]) * 60 + int(value[17:19])
+    if seconds_of_day >= SECONDS_PER_DAY:
+        raise ValueError(f"time data '{value}' does not match format '{TIMESTAMP_FORMAT}'")
+    return day * SECONDS_PER_DAY + seconds_of_day, day
+
+def parse_each_timestamp(values, day_cache):
+    times = [parse_timestamp(value, day_cache) for value in values]
+    return [seconds for seconds, _ in times], [day for _, day in times]
+
+def parse_timestamps(values, day_cache):
+    # A whole batch at once, each digit position is one strided slice of the joined timestamps.
+    # Dates are cached by their YYYYMMDD number. Anything out of the fixed layout goes through parse_timestamp.
+    try:
+        text = "".join(values).encode("ascii")
+    except (TypeError, UnicodeEncodeError):
+        text = None
+    count = len(values)
+    if text is None or text.translate(TIMESTAMP_DIGITS) != TIMESTAMP_TEMPLATE * count:
+        return parse_each_timestamp(values, day_cache)
+    digits = [text[position::20] for position in range(20)]
+    dates = [y1 * 10000000 + y2 * 1000000 + y3 * 100000 + y4 * 10000 + m1 * 1000 + m2 * 100 + d1 * 10 + d2 - DATE_ZEROS
+             for y1, y2, y3, y4, m1, m2, d1, d2 in zip(*digits[0:4], *digits[5:7], *digits[8:10])]
+    for key in set(dates).difference(day_cache):
+        day_cache[key] = date(key // 10000, key // 100 % 100, key % 100).toordinal() - EPOCH_ORDINAL
+    days = list(map(day_cache.__getitem__, dates))
+    seconds_of_day = [h1 * 36000 + h2 * 3600 + m1 * 600 + m2 * 60 + s1 * 10 + s2 - TIME_ZEROS
+                      for h1, h2, m1, m2, s1, s2 in zip(*digits[11:13], *digits[14:16], *digits[17:19])]
+    if seconds_of_day and max(seconds_of_day) >= SECONDS_PER_DAY:
+        return parse_each_timestamp(values, day_cache)
+    return [day * SECONDS_PER_DAY + seconds for day, seconds in zip(days, seconds_of_day)], days
+
+def is_episode(record):
+    return any(record.get(field) is not None for field in EPISODE_FIELDS)
+
+def day_to_date(day):
+    return date.fromordinal(day + EPOCH_ORDINAL)
+
+class StringTable:
+    def __init__(self, values=None):
+        self.values = []
+        self.codes = {}
+        for value in values or ():
+            self.encode(value)
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def decode(self, code):
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+class Bitmap:
+    def __init__(self):
+        self.bits = bytearray()
+        self.length = 0
+
+    @classmethod
+    def from_bytes(cls, bits, length):
+        bitmap = cls()
+        bitmap.bits = bytearray(bits)
+        bitmap.length = length
+        return bitmap
+
+    def append(self, value):
+        index = self.length
+        if index % 8 == 0:
+            self.bits.append(0)
+        if value:
+            self.bits[index >> 3] |= 1 << (index & 7)
+        self.length += 1
+
+    def extend_values(self, values):
+        values = list(values)
+        head = -self.length % 8
+        for value in values[:head]:
+            self.append(value)
+        rest = values[head:]
+        if rest:
+            # Byte aligned, the flags are packed through one integer whose bit i is the i-th flag.
+            digits = bytes(map(bool, reversed(rest))).translate(BIT_DIGITS)
+            self.bits.extend(int(digits, 2).to_bytes((len(rest) + 7) >> 3, 'little'))
+            self.length += len(rest)
+
+    def extend(self, other):
+        if self.length % 8 == 0:
+            # Byte aligned, the other bitmap's bytes are copied as they are.
+            self.bits.extend(other.bits[:(other.length + 7) >> 3])
+            self.length += other.length
+        else:
+            for value in other:
+                self.append(value)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("bitmap index out of range")
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        remaining = self.length
+        for byte in self.bits:
+            for bit in range(min(8, remaining)):
+                yield bool(byte & (1 << bit))
+            remaining -= 8
+
+    def set_indices(self, start=0, stop=None):
+        stop = self.length if stop is None else min(stop, self.length)
+        bits = self.bits
+        for byte_index in range(start >> 3, (stop + 7) >> 3):
+            byte = bits[byte_index]
+            if not byte:
+                continue
+            base = byte_index << 3
+            for bit in range(8):
+                if byte & (1 << bit) and start <= base + bit < stop:
+                    yield base + bit
+
+class PlayStore:
+    def __init__(self, skip_podcasts=False):
+        self.ms_played = array('q')
+        self.ts = array('q')
+        self.day = array('i')
+        self.track = array('i')
+        self.artist = array('i')
+        self.platform = array('i')
+        self.reason_start = array('i')
+        self.reason_end = array('i')
+        self.ip_address = array('i')
+        self.skipped = Bitmap()
+        self.shuffle = Bitmap()
+
+        self.tracks = StringTable()
+        self.artists = StringTable()
+        self.platforms = StringTable()
+        self.reasons = StringTable()
+        self.ip_addresses = StringTable()
+
+        self.skip_podcasts = skip_podcasts
+        self.day_cache = {}
+        self.date_strings = {}
+
+    def __len__(self):
+        return len(self.ts)
+
+    def table(self, column):
+        return getattr(self, STRING_TABLES[column])
+
+    def extend(self, records):
+        # Column by column, only the used fields are read from the records and every column grows in one call.
+        # All columns are built before any is extended, so a bad play cannot leave columns of different lengths.
+        records = list(records)
+        if self.skip_podcasts:
+            records = [record for record in records if not is_episode(record)]
+        seconds, days = parse_timestamps([record["ts"] for record in records], self.day_cache)
+        ms_played = [value or 0 for value in map(dict.get, records, repeat("ms_played"))]
+        codes = {}
+        for column, field in STRING_FIELDS.items():
+            table = self.table(column)
+            values = list(map(dict.get, records, repeat(field)))
+            # Distinct values in order of first appearance, so codes are numbered as when appending one by one.
+            for value in dict.fromkeys(values):
+                table.encode(value)
+            codes[column] = list(map(table.codes.__getitem__, values))
+        flags = {flag: list(map(dict.get, records, repeat(flag))) for flag in FLAG_FIELDS}
+
+        self.ts.extend(seconds)
+        self.day.extend(days)
+        self.ms_played.extend(ms_played)
+        for column, column_codes in codes.items():
+            getattr(self, column).extend(column_codes)
+        for flag, values in flags.items():
+            getattr(self, flag).extend_values(values)
+
+    def extend_store(self, other):
+        # Appends the plays of another store, its codes are translated to this store's lookup tables.
+        for name in TABLE_NAMES:
+            table = getattr(self, name)
+            translation = [table.encode(value) for value in getattr(other, name).values]
+            for column, table_name in STRING_TABLES.items():
+                if table_name == name:
+                    getattr(self, column).extend(array('i', map(translation.__getitem__, getattr(other, column))))
+        for name in ("ms_played", "ts", "day"):
+            getattr(self, name).extend(getattr(other, name))
+        for flag in FLAG_FIELDS:
+            getattr(self, flag).extend(getattr(other, flag))
+        self.day_cache.update(other.day_cache)
+
+    def clear_rows(self, clear_tables=False):
+        # Drops the plays. The lookup tables are kept unless asked, so codes stay stable across ingest batches.
+        for name in ARRAY_COLUMNS:
+            del getattr(self, name)[:]
+        for flag in FLAG_FIELDS:
+            setattr(self, flag, Bitmap())
+        if clear_tables:
+            for name in TABLE_NAMES:
+                setattr(self, name, StringTable())
+
+    def value(self, column, index):
+        return self.table(column).decode(getattr(self, column)[index])
+
+    def date_string(self, index):
+        day = self.day[index]
+        value = self.date_strings.get(day)
+        if value is None:
+            value = self.date_strings[day] = day_to_date(day).isoformat()
+        return value
+
+    def time_string(self, index):
+        minutes, seconds = divmod(self.ts[index] % SECONDS_PER_DAY, 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+    def record(self, index):
+        record = {field: self.value(column, index) for column, field in STRING_FIELDS.items()}
+        record["ts"] = f"{self.date_string(index)}T{self.time_string(index)}Z"
+        record["ms_played"] = self.ms_played[index]
+        for flag in FLAG_FIELDS:
+            record[flag] = getattr(self, flag)[index]
+        return record
@@ -0,0 +1,143 @@
+from collections import Counter
+from kernels import group_totals
+from play_store import StringTable, day_to_date
+
+GRAINS = ("day", "week", "month", "year")
+DIMENSIONS = ("period", "track", "artist", "platform")
+MEASURES = ("plays", "ms_played", "skips")
+
+class RollupTable:
+    def __init__(self, grain, dimensions=DIMENSIONS):
+        self.grain = grain
+        self.dimensions = dimensions
+        # (period, track, artist, platform) -> [plays, ms_played, skips]
+        self.rows = {}
+        # Totals per period are kept up to date, trend views never scan the rows.
+        self.period_totals = {measure: Counter() for measure in MEASURES}
+        self.cached_totals = {}
+
+    def __len__(self):
+        return len(self.rows) if len(self.dimensions) > 1 else len(self.period_totals["plays"])
+
+    def merge(self, delta, day_totals, period_of=None):
+        # Adds the rows of a finer grain, mapping their periods to this grain.
+        # With the period as the only dimension the rows would repeat the period totals, only those are kept.
+        rows = self.rows
+        if len(self.dimensions) > 1:
+            for key, (plays, ms_played, skips) in delta.items():
+                if period_of is not None:
+                    key = (period_of[key[0]],) + key[1:]
+                row = rows.get(key)
+                if row is None:
+                    rows[key] = [plays, ms_played, skips]
+                else:
+                    row[0] += plays
+                    row[1] += ms_played
+                    row[2] += skips
+        for day, measures in day_totals.items():
+            period = day if period_of is None else period_of[day]
+            for measure, value in zip(MEASURES, measures):
+                self.period_totals[measure][period] += value
+        self.cached_totals.clear()
+
+    def merge_table(self, other, translations):
+        # Rows of the same grain from another cube, with its dimension codes translated to ours.
+        rows = self.rows
+        for key, (plays, ms_played, skips) in other.rows.items():
+            key = (key[0],) + tuple(translation[code] for translation, code in zip(translations, key[1:]))
+            row = rows.get(key)
+            if row is None:
+                rows[key] = [plays, ms_played, skips]
+            else:
+                row[0] += plays
+                row[1] += ms_played
+                row[2] += skips
+        for measure in MEASURES:
+            self.period_totals[measure].update(other.period_totals[measure])
+        self.cached_totals.clear()
+
+    def totals(self, measure="plays", by=("period",)):
+        by = tuple(by)
+        if by == ("period",):
+            return self.period_totals[measure]
+        key = (measure, by)
+        totals = self.cached_totals.get(key)
+        if totals is None:
+            position = MEASURES.index(measure)
+            indices = [self.dimensions.index(name) for name in by]
+            totals = Counter()
+            for group, row in self.rows.items():
+                totals[group[indices[0]] if len(indices) == 1 else tuple(group[index] for index in indices)] += row[position]
+            self.cached_totals[key] = totals
+        return totals
+
+class RollupCube:
+    def __init__(self, dimensions=DIMENSIONS):
+        # Leaving out track, artist or platform keeps the tables small, the default rollups only keep the period.
+        self.dimensions = dimensions
+        self.tables = {grain: RollupTable(grain, dimensions) for grain in GRAINS}
+        # Lookup tables of the dimension codes, shared with the store the plays come from.
+        self.lookups = {}
+        # Day number -> period of each coarser grain, filled once per distinct day.
+        self.periods = {grain: {} for grain in GRAINS[1:]}
+
+    def add_periods(self, days):
+        weeks, months, years = (self.periods[grain] for grain in GRAINS[1:])
+        for day in days:
+            if day not in weeks:
+                current = day_to_date(day)
+                # Weeks start on Monday, day 0 (1970-01-01) was a Thursday.
+                weeks[day] = day - (day + 3) % 7
+                months[day] = current.year * 100 + current.month
+                years[day] = current.year
+
+    def update(self, store, start, stop):
+        if start == stop:
+            return
+        for name in self.dimensions[1:]:
+            self.lookups[name] = store.table(name)
+
+        # The batch is reduced to one row per day, track, artist and platform before touching the tables.
+        keys = [store.day[start:stop]] + [getattr(store, name)[start:stop] for name in self.dimensions[1:]]
+        delta = group_totals(keys, [store.ms_played[start:stop]], [(store.skipped, start, stop)])
+        day_totals = {}
+        for key, (count, ms, skipped) in delta.items():
+            totals = day_totals.get(key[0])
+            if totals is None:
+                day_totals[key[0]] = [count, ms, skipped]
+            else:
+                totals[0] += count
+                totals[1] += ms
+                totals[2] += skipped
+
+        # Coarser grains roll up the reduced day rows, not the plays.
+        self.add_periods(day_totals)
+        self.tables["day"].merge(delta, day_totals)
+        for grain in GRAINS[1:]:
+            self.tables[grain].merge(delta, day_totals, self.periods[grain])
+
+    def merge(self, other):
+        if self.dimensions != other.dimensions:
+            raise ValueError("Rollups with different dimensions cannot be merged.")
+        translations = []
+        for name in self.dimensions[1:]:
+            lookup = self.lookups.setdefault(name, StringTable())
+            other_lookup = other.lookups.get(name)
+            translations.append([lookup.encode(value) for value in other_lookup.values] if other_lookup else [])
+        for grain, table in self.tables.items():
+            table.merge_table(other.tables[grain], translations)
+        for grain, periods in self.periods.items():
+            periods.update(other.periods[grain])
+
+    def totals(self, grain, measure="plays", by=("period",)):
+        # Dimension codes are decoded, periods stay as day numbers, week starts, yyyymm or years.
+        totals = self.tables[grain].totals(measure, by)
+        if all(name == "period" for name in by):
+            return totals
+        decoders = [None if name == "period" else self.lookups[name].values for name in by]
+        if len(decoders) == 1:
+            return Counter({decoders[0][code]: value for code, value in totals.items()})
+        decoded = Counter()
+        for group, value in totals.items():
+            decoded[tuple(code if values is None else values[code] for code, values in zip(group, decoders))] += value
+        return decoded
@@ -0,0 +1,155 @@
+from array import array
+from bisect import bisect_left
+from operator import le
+from collections import Counter
+from kernels import session_breaks
+from play_store import StringTable
+
+# A pause longer than this between two plays starts a new listening session.
+DEFAULT_GAP_MINUTES = 30
+
+class Sessions:
+    # One compact record per session in parallel columns, built in a single pass over plays in timestamp order.
+    # Only the last session is open, plays appended later extend it or start new ones.
+    def __init__(self, gap_minutes=DEFAULT_GAP_MINUTES):
+        self.gap_ms = int(gap_minutes * 60000)
+        self.clear()
+
+    def clear(self):
+        # Rows are positions of the plays in time order, the same as store rows when the store is in time order.
+        self.first_row = array('q')
+        self.stop_row = array('q')
+        # Epoch milliseconds, a session starts when its first play starts and ends with its latest play.
+        self.start_ms = array('q')
+        self.end_ms = array('q')
+        self.plays = array('i')
+        self.ms_played = array('q')
+        self.skips = array('i')
+        self.reason = array('i')
+        self.reasons = StringTable()
+        self.rows = 0
+        # End of the first play and latest end seen, a play ending before latest_end came out of time order.
+        self.first_end = None
+        self.latest_end = None
+        # Store rows sorted by timestamp, only kept once a store turned out not to be in time order.
+        self.order = None
+        # Set when plays came out of time order and could not be sorted, e.g. streamed batches or merged files.
+        self.unsorted = False
+
+    def __len__(self):
+        return len(self.plays)
+
+    def update(self, store, start, stop):
+        if start == stop:
+            return
+        ts = store.ts[start:stop]
+        in_order = (self.latest_end is None or ts[0] * 1000 >= self.latest_end) and all(map(le, ts, ts[1:]))
+        if in_order and self.order is None:
+            skipped = [row - start for row in store.skipped.set_indices(start, stop)]
+            self.add(store, ts, store.ms_played[start:stop], skipped, range(start, stop))
+        elif start == self.rows and not self.unsorted:
+            # The store still holds every play seen, like PlayIndex they are walked in timestamp order instead.
+            new_rows = sorted(range(start, stop), key=store.ts.__getitem__)
+            if self.order is not None and store.ts[new_rows[0]] >= store.ts[self.order[-1]]:
+                self.order.extend(new_rows)
+                self.add_rows(store, new_rows)
+            else:
+                order = sorted(range(stop), key=store.ts.__getitem__)
+                self.clear()
+                self.order = array('i', order)
+                self.add_rows(store, order)
+        else:
+            # Earlier plays were dropped, out of order plays make the sessions unreliable and are reported as such.
+            self.unsorted = self.unsorted or not in_order
+            skipped = [row - start for row in store.skipped.set_indices(start, stop)]
+            self.add(store, ts, store.ms_played[start:stop], skipped, range(start, stop))
+
+    def add_rows(self, store, rows):
+        skipped_rows = set(store.skipped.set_indices(min(rows), max(rows) + 1))
+        skipped = [position for position, row in enumerate(rows) if row in skipped_rows]
+        self.add(store, array('q', map(store.ts.__getitem__, rows)), array('q', map(store.ms_played.__getitem__, rows)),
+                 skipped, rows)
+
+    def add(self, store, ts, ms_played, skipped, rows):
+        # ts and ms_played of the plays in the order they are added, skipped holds positions and rows the store rows.
+        if self.first_end is None:
+            self.first_end = ts[0] * 1000
+        breaks, self.latest_end = session_breaks(ts, ms_played, self.gap_ms, self.latest_end)
+        bounds = breaks + [len(ts)]
+
+        # Plays before the first break continue the open session.
+        if bounds[0]:
+            self.extend_last(ts, ms_played, skipped, 0, bounds[0])
+        for first, last in zip(bounds, bounds[1:]):
+            self.first_row.append(self.rows + first)
+            self.stop_row.append(self.rows + first)
+            self.start_ms.append(ts[first] * 1000 - ms_played[first])
+            self.end_ms.append(ts[first] * 1000)
+            self.plays.append(0)
+            self.ms_played.append(0)
+            self.skips.append(0)
+            self.reason.append(self.reasons.encode(store.value("reason_start", rows[first])))
+            self.extend_last(ts, ms_played, skipped, first, last)
+        self.rows += len(ts)
+
+    def extend_last(self, ts, ms_played, skipped, first, last):
+        self.stop_row[-1] = self.rows + last
+        self.end_ms[-1] = max(self.end_ms[-1], max(ts[first:last]) * 1000)
+        self.plays[-1] += last - first
+        self.ms_played[-1] += sum(ms_played[first:last])
+        self.skips[-1] += bisect_left(skipped, last) - bisect_left(skipped, first)
+
+    def merge(self, other):
+        # Sessions of the plays that follow ours, e.g. the next file, the first one may continue our open session.
+        self.unsorted = self.unsorted or other.unsorted
+        if not len(other):
+            self.rows += other.rows
+            return
+        if self.latest_end is not None and other.first_end < self.latest_end:
+            # The other plays end before ours do, e.g. files not named in time order.
+            self.unsorted = True
+        offset = self.rows
+        translation = [self.reasons.encode(value) for value in other.reasons.values]
+        first = 0
+        if len(self) and other.start_ms[0] - self.latest_end <= self.gap_ms:
+            self.stop_row[-1] = other.stop_row[0] + offset
+            self.end_ms[-1] = max(self.end_ms[-1], other.end_ms[0])
+            self.plays[-1] += other.plays[0]
+            self.ms_played[-1] += other.ms_played[0]
+            self.skips[-1] += other.skips[0]
+            first = 1
+        self.first_row.extend(row + offset for row in other.first_row[first:])
+        self.stop_row.extend(row + offset for row in other.stop_row[first:])
+        self.start_ms.extend(other.start_ms[first:])
+        self.end_ms.extend(other.end_ms[first:])
+        self.plays.extend(other.plays[first:])
+        self.ms_played.extend(other.ms_played[first:])
+        self.skips.extend(other.skips[first:])
+        self.reason.extend(translation[code] for code in other.reason[first:])
+        self.rows += other.rows
+        self.latest_end = other.latest_end if self.latest_end is None else max(self.latest_end, other.latest_end)
+        if self.first_end is None:
+            self.first_end = other.first_end
+
+    def lengths(self):
+        return [end - start for start, end in zip(self.start_ms, self.end_ms)]
+
+    def start_reasons(self):
+        values = self.reasons.values
+        return Counter({values[code]: count for code, count in Counter(self.reason).items()})
+
+    def summary(self):
+        count = len(self)
+        if not count:
+            return None
+        lengths = self.lengths()
+        return {
+            "gap_minutes": self.gap_ms / 60000,
+            "sessions": count,
+            "average_minutes": sum(lengths) / count / 60000,
+            "longest_minutes": max(lengths) / 60000,
+            "average_tracks": sum(self.plays) / count,
+            "skip_rate": sum(skips / plays for skips, plays in zip(self.skips, self.plays)) / count,
+            "start_reasons": self.start_reasons(),
+            "unsorted": self.unsorted,
+        }
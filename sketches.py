@@ -0,0 +1,150 @@
+import math
+
+from array import array
+from hashlib import blake2b
+from heapq import nlargest
+from collections import Counter
+
+DEFAULT_ERROR = 0.001
+DEFAULT_CONFIDENCE = 0.99
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+
+def hash_value(value):
+    # Two independent 64-bit hashes, one for HyperLogLog and one for Count-Min.
+    data = b"\x00" if value is None else b"\x01" + str(value).encode("utf-8", "surrogatepass")
+    digest = blake2b(data, digest_size=16).digest()
+    return int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big")
+
+class Estimates(Counter):
+    # Estimated counts of the monitored items, used wherever an exact Counter is expected.
+    def __init__(self, counts=None, distinct=0, max_overcount=0):
+        super().__init__(counts or {})
+        self.distinct = distinct
+        self.max_overcount = max_overcount
+
+    def __reduce__(self):
+        return self.__class__, (dict(self), self.distinct, self.max_overcount)
+
+class SpaceSaving:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+
+    def floor(self):
+        # Upper bound of the count of any item that is not monitored.
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def update(self, counts):
+        # Exact counts of a batch are merged as a summary without error.
+        self.merge_counts(counts, {}, 0, sum(counts.values()))
+
+    def merge(self, other):
+        self.merge_counts(other.counts, other.errors, other.floor(), other.total)
+
+    def merge_counts(self, counts, errors, floor, total):
+        own_floor = self.floor()
+        merged = {}
+        merged_errors = {}
+        for item in self.counts.keys() | counts.keys():
+            merged[item] = self.counts.get(item, own_floor) + counts.get(item, floor)
+            merged_errors[item] = self.errors.get(item, own_floor) + errors.get(item, floor)
+        self.counts = dict(nlargest(self.capacity, merged.items(), key=lambda x: x[1]))
+        self.errors = {item: merged_errors[item] for item in self.counts}
+        self.total += total
+
+class CountMinSketch:
+    def __init__(self, width, depth):
+        self.width = width
+        self.depth = depth
+        self.table = array('q', bytes(8 * width * depth))
+
+    @classmethod
+    def from_error(cls, error, confidence=DEFAULT_CONFIDENCE):
+        # Over-counts by at most error * total with the given probability.
+        return cls(math.ceil(math.e / error), math.ceil(math.log(1 / (1 - confidence))))
+
+    def indices(self, hash_value):
+        low, high = hash_value & 0xFFFFFFFF, hash_value >> 32 | 1
+        return [row * self.width + (low + row * high) % self.width for row in range(self.depth)]
+
+    def add(self, hash_value, count=1):
+        table = self.table
+        for index in self.indices(hash_value):
+            table[index] += count
+
+    def estimate(self, hash_value):
+        table = self.table
+        return min(table[index] for index in self.indices(hash_value))
+
+    def merge(self, other):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Count-Min sketches of different sizes cannot be merged.")
+        self.table = array('q', map(sum, zip(self.table, other.table)))
+
+class HyperLogLog:
+    def __init__(self, precision):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @classmethod
+    def from_error(cls, error):
+        # The standard error of the estimate is about 1.04 / sqrt(registers).
+        precision = math.ceil(math.log2((1.04 / error) ** 2))
+        return cls(min(max(precision, MIN_PRECISION), MAX_PRECISION))
+
+    def add(self, hash_value):
+        bits = 64 - self.precision
+        index = hash_value >> bits
+        rank = bits - (hash_value & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self):
+        registers = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(registers, 0.7213 / (1 + 1.079 / registers))
+        estimate = alpha * registers * registers / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * registers and zeros:
+            # Linear counting is more accurate for small cardinalities.
+            estimate = registers * math.log(registers / zeros)
+        return round(estimate)
+
+    def merge(self, other):
+        if self.precision != other.precision:
+            raise ValueError("HyperLogLog sketches of different precisions cannot be merged.")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+class ItemSketch:
+    # Space-Saving picks the heavy hitters, Count-Min tightens their counts and HyperLogLog counts distinct items.
+    def __init__(self, error=DEFAULT_ERROR, confidence=DEFAULT_CONFIDENCE):
+        self.error = error
+        self.top = SpaceSaving(math.ceil(1 / error))
+        self.frequencies = CountMinSketch.from_error(error, confidence)
+        self.distinct = HyperLogLog.from_error(error)
+
+    def update(self, counts):
+        for value, count in counts.items():
+            distinct_hash, frequency_hash = hash_value(value)
+            self.frequencies.add(frequency_hash, count)
+            if value is not None:
+                self.distinct.add(distinct_hash)
+        self.top.update(counts)
+
+    def merge(self, other):
+        self.top.merge(other.top)
+        self.frequencies.merge(other.frequencies)
+        self.distinct.merge(other.distinct)
+
+    def estimate(self, value):
+        # Both estimates are upper bounds of the true count, the smaller one is kept.
+        estimate = self.frequencies.estimate(hash_value(value)[1])
+        if value in self.top.counts:
+            estimate = min(estimate, self.top.counts[value])
+        return estimate
+
+    def estimates(self):
+        return Estimates({value: self.estimate(value) for value in self.top.counts},
+                         self.distinct.estimate(), math.ceil(self.error * self.top.total))
@@ -1,465 +1,440 @@
-import os
-import json
-import openpyxl # type: ignore
-import calendar
-import tkinter as tk
-import matplotlib.pyplot as plt # type: ignore
-
-from heapq import nlargest
-from itertools import groupby
-from datetime import datetime
-from tkinter import filedialog
-from collections import Counter, defaultdict
-
-class SpotifyAnalyzerApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Spotify Analyzer")
-
-        self.current_json_file = None
-        self.json_data = None
-
-        self.create_widgets()
-        
-    def create_widgets(self):
-        buttons_frame = tk.Frame(self.root)
-        buttons_frame.pack(pady=10)
-
-        open_file_button = tk.Button(buttons_frame, text="Open JSON File", command=self.open_file, font=("Arial", 14))
-        open_file_button.grid(row=0, column=0, padx=10)
-
-        analyze_button = tk.Button(buttons_frame, text="Analyze", command=self.analyze, font=("Arial", 14))
-        analyze_button.grid(row=0, column=1, padx=10)
-
-        exit_button = tk.Button(buttons_frame, text="Exit", command=self.root.destroy, font=("Arial", 14))
-        exit_button.grid(row=0, column=2, padx=10)
-
-        options_frame = tk.Frame(self.root)
-        options_frame.pack(pady=10)
-
-        options_label = tk.Label(options_frame, text="Select an option:", font=("Arial", 16))
-        options_label.grid(row=0, column=0, padx=10)
-
-        self.options_var = tk.StringVar(self.root)
-        self.options_var.set("Show total of songs listened")
-        options_menu = tk.OptionMenu(options_frame, self.options_var,
-                             "Show total of songs listened",
-                             "Total time spent listened",
-                             "Show first and last played songs",
-                             "Show the top 5 most played songs",
-                             "Show the top 5 most played artists",
-                             "Show the most skipped songs", 
-                             "Show the average song duration",
-                             "Show daily listening patterns",
-                             "Show yearly statistics",
-                             "Show daily playtime statistics",
-                             "Show analysis of most used devices",
-                             "Show statistical graphs",
-                             "Analyze playback reasons",
-                             "Export statistics to Excel")
-        options_menu.config(font=("Arial", 14))
-        options_menu.grid(row=0, column=1, padx=10)
-
-        results_frame = tk.Frame(self.root)
-        results_frame.pack(pady=20)
-
-        self.results_text = tk.Text(results_frame, height=20, width=50, wrap=tk.WORD, font=("Arial", 16))
-        self.results_text.grid(row=0, column=0, padx=10)
-        self.results_text.config(state=tk.DISABLED)
-
-    def open_file(self):
-        file_path = filedialog.askopenfilename(title="Select JSON File", filetypes=[("JSON files", "*.json")])
-        if file_path:
-            self.json_data = self.open_json_file(file_path)
-            if self.json_data:
-                results = "JSON file loaded successfully.\n"
-                self.results_text.delete(1.0, tk.END)
-                self.results_text.insert(tk.END, results)
-                self.show_results(results)
-            else:
-                results = "Error loading JSON file.\n"
-                self.results_text.delete(1.0, tk.END)
-                self.results_text.insert(tk.END, results)
-                self.show_results()
-
-    def analyze(self):
-        if not self.json_data:
-            results = "No JSON file loaded. Please open a JSON file first.\n"
-            self.results_text.delete(1.0, tk.END)
-            self.results_text.insert(tk.END, results)
-            self.show_results(results)
-            return
-        
-        selected_option = self.options_var.get()
-        self.results_text.delete(1.0, tk.END)
-
-        if selected_option == "Show total of songs listened":
-            self.show_total_songs_listened()
-        elif selected_option == "Total time spent listened":
-            self.show_total_time_listened()
-        elif selected_option == "Show first and last played songs":
-            self.show_first_and_last_played_songs()
-        elif selected_option == "Show the top 5 most played songs":
-            self.show_top_played_songs()
-        elif selected_option == "Show the top 5 most played artists":
-            self.show_top_artists()
-        elif selected_option == "Show the most skipped songs":
-            self.show_most_skipped_songs()
-        elif selected_option == "Show the average song duration":
-            self.show_avg_duration()
-        elif selected_option == "Show daily listening patterns":
-            self.show_daily_listening_patterns()
-        elif selected_option == "Show yearly statistics":
-            self.show_yearly_statistics()
-        elif selected_option == "Show daily playtime statistics":
-            self.show_daily_playtime_statistics()
-        elif selected_option == "Show analysis of most used devices":
-            self.show_most_used_devices()
-        elif selected_option == "Show statistical graphs":
-            self.show_graphs()
-        elif selected_option == "Analyze playback reasons":
-            self.analyze_playback_reasons()
-        elif selected_option == "Export statistics to Excel":
-            self.export_to_excel() 
-        else:
-            self.results_text.insert(tk.END, "Invalid option. Please choose a valid option.\n")
-    
-    def show_results(self, results):
-        self.results_text.config(state=tk.NORMAL)
-        self.results_text.delete("1.0", tk.END)
-        self.results_text.insert(tk.END, results)
-        self.results_text.config(state=tk.DISABLED)
-        
-    def handle_exception(self, exception, error_message):
-        self.results_text.insert(tk.END, f"Error: {exception}\n{error_message}\n")
-
-    def open_json_file(self, file_path):
-        try:
-            if not os.path.isfile(file_path):
-                raise FileNotFoundError(f"The file '{file_path}' does not exist.")
-
-            with open(file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                self.current_json_file = file_path
-                return data
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            self.handle_exception(e, "Error loading JSON file.")
-            return None
-
-    def show_total_songs_listened(self):
-        total_songs = len(self.json_data)
-        results = f"Total number of songs listened: {total_songs}\n\n"
-        self.show_results(results)
-
-    def show_total_time_listened(self):
-        total_time_ms = sum(info_reproduccion["ms_played"] for info_reproduccion in self.json_data)
-        total_time_sec = total_time_ms / 1000
-        total_time_min, total_time_sec = divmod(total_time_sec, 60)
-        total_time_hr, total_time_min = divmod(total_time_min, 60)
-        total_time_days, total_time_hr = divmod(total_time_hr, 24)
-
-        results = f"Total time spent listened: {int(total_time_days)} days, {int(total_time_hr)} hours, {int(total_time_min)} minutes, {int(total_time_sec)} seconds\n\n"
-        self.show_results(results)
-    
-    def show_first_and_last_played_songs(self):
-    
-        first_song = self.json_data[0]            
-        last_song = self.json_data[-1]
-        first_song_info = self.format_song_info(first_song)
-        last_song_info = self.format_song_info(last_song)
-            
-        results = f"First song played: {first_song_info}\n"
-        results += f"Last song played: {last_song_info}\n"
-
-        self.show_results(results)
-   
-    def format_song_info(self, song):
-        title = song.get('master_metadata_track_name', 'Unknown Title')
-        artist = song.get('master_metadata_album_artist_name', 'Unknown Artist')
-        timestamp_str = song.get('ts', 'Unknown Timestamp')
-
-        timestamp = datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%SZ")
-
-        formatted_timestamp = timestamp.strftime("%Y-%m-%d at %H:%M:%S")
-
-        return f'"{title}" by "{artist}" on {formatted_timestamp}\n'
-    
-    def show_top_items(self, data, item_name):
-        played_items = defaultdict(int)
-        for playback_info in self.json_data:
-            item = playback_info[data] if playback_info[data] is not None else "Unknown"
-            played_items[item] += 1
-
-        top_played_items = nlargest(5, played_items.items(), key=lambda x: x[1])
-
-        results = f"Top 5 most played {item_name}s:\n"
-        for idx, (item, plays) in enumerate(top_played_items, start=1):
-            results += f"{idx}. {item}, Plays: {plays}\n"
-        results += "\n"
-        self.show_results(results)
-
-    def show_top_played_songs(self):
-        self.show_top_items("master_metadata_track_name", "Song")
-
-    def show_top_artists(self):
-        self.show_top_items("master_metadata_album_artist_name", "Artist")
-
-    def show_most_skipped_songs(self):
-        skipped_songs = [info["master_metadata_track_name"] for info in self.json_data if info.get("skipped")]
-        skipped_songs_counter = Counter(skipped_songs)
-        top_skipped_songs = nlargest(5, skipped_songs_counter.items(), key=lambda x: x[1])
-        
-        results = f"Top 5 most skipped songs:\n"
-        for idx, (song, skips) in enumerate(top_skipped_songs, start=1):
-            results += f"{idx}. {song}, Skips: {skips}\n"
-        results += "\n"
-        self.show_results(results)
-    
-    def show_avg_duration(self):
-        total_durations = sum(info["ms_played"] for info in self.json_data)
-        avg_duration_ms = total_durations / len(self.json_data)
-        avg_duration_minutes = avg_duration_ms / 60000
-
-        results = f"Average song duration: {avg_duration_minutes:.2f} minutes\n\n"
-        self.show_results(results)
-
-    def show_daily_listening_patterns(self):
-        timestamps = [datetime.strptime(info["ts"], "%Y-%m-%dT%H:%M:%SZ") for info in self.json_data]
-        timestamps.sort()
-
-        daily_patterns = defaultdict(int)
-        for day, plays in groupby(timestamps, key=lambda x: x.date()):
-            daily_patterns[day] += len(list(plays))
-
-        results = "Daily listening patterns:\n"
-        for day, plays in daily_patterns.items():
-            results += f"{day}: {plays} plays\n"
-
-        self.show_results(results)
-
-    def show_yearly_statistics(self):
-        years = [datetime.strptime(info.get("ts"), "%Y-%m-%dT%H:%M:%SZ").year for info in self.json_data]
-        year_counter = Counter(years)
-
-        results = "Listening statistics by year:\n"
-        for year, plays in sorted(year_counter.items()):
-            results += f"{year}: {plays} plays\n"
-        results += "\n"
-        self.show_results(results)
-
-    def show_daily_playtime_statistics(self):
-        playtimes = [info.get("ms_played", 0) for info in self.json_data]
-        playtimes = [playtime / (1000 * 60 * 60) for playtime in playtimes]  
-
-        daily_playtime = defaultdict(float)
-
-        for day, playtimes_group in groupby(zip(self.json_data, playtimes), key=lambda x: datetime.strptime(x[0]["ts"], "%Y-%m-%dT%H:%M:%SZ").date()):
-            total_playtime = sum(playtime for _, playtime in playtimes_group)
-            daily_playtime[day.strftime("%A")] += total_playtime
-
-        sorted_daily_playtime = dict(sorted(daily_playtime.items(), key=lambda x: list(calendar.day_name).index(x[0])))
-
-        results = "Daily playtime statistics:\n"
-        for day, total_playtime in sorted_daily_playtime.items():
-            results += f"{day}: {total_playtime:.2f} hours\n"
-        results += "\n"
-        self.show_results(results)
-
-    def show_most_used_devices(self):
-        used_devices = Counter(info["platform"] for info in self.json_data)
-        results = "Analysis of most used devices:\n"
-        
-        for idx, (device, count) in enumerate(used_devices.most_common(), start=1):
-            results += f"{idx}. {device}: {count} plays\n"
-        
-        results += "\n"
-        self.show_results(results)
-        
-        self.results_text.insert(tk.END, "Analysis of most used devices:\n")
-        for idx, (device, count) in enumerate(used_devices.most_common(), start=1):
-            self.results_text.insert(tk.END, f"{idx}. {device}: {count} plays\n")
-       
-    def show_graphs(self):
-        graph_options = {
-            "1": ("show_top_played_songs_graph", "Show Top Played Songs"),
-            "2": ("show_top_artists_graph", "Show Top Artists"),
-            "3": ("show_playback_time_distribution_graph", "Show Playback Time Distribution"),
-            "4": ("show_playback_trends_graph", "Show Playback Trends"),
-        }
-
-        graph_options_window = tk.Toplevel(self.root)
-        graph_options_window.title("Graph Options")
-
-        label = tk.Label(graph_options_window, text="Choose a graph to display:")
-        label.pack(pady=10)
-
-        for key, (_, label) in graph_options.items():
-            button = tk.Button(graph_options_window, text=label, command=lambda key=key: self.display_graph(graph_options[key]))
-            button.pack()
-     
-    def display_graph(self, graph_option):
-        graph_function_name, _ = graph_option
-        graph_function = getattr(self, graph_function_name)
-        graph_function()
-
-    def show_top_played_songs_graph(self):
-        played_songs = Counter(
-            info["master_metadata_track_name"]
-            if info["master_metadata_track_name"] is not None
-            else "None"
-            for info in self.json_data
-        )
-
-        top_played_songs = nlargest(5, played_songs.items(), key=lambda x: x[1])
-
-        song_names = []
-        plays_list = []
-
-        for song, plays in top_played_songs:
-            song_names.append(song)
-            plays_list.append(plays)
-
-        plt.figure(figsize=(10, 6))
-        plt.barh(song_names, plays_list, color='lightblue')
-        plt.xlabel('Plays')
-        plt.ylabel('Songs')
-        plt.title('Top Played Songs')
-        plt.tight_layout()
-        plt.show()
-
-    def show_top_artists_graph(self):
-        played_artists = Counter(info["master_metadata_album_artist_name"] for info in self.json_data)
-        top_played_artists = nlargest(5, played_artists.items(), key=lambda x: x[1])
-
-        artist_names = [artist for artist, _ in top_played_artists]
-        plays = [plays for _, plays in top_played_artists]
-
-        plt.figure(figsize=(10, 6))
-        plt.barh(artist_names, plays, color='lightcoral')
-        plt.xlabel('Plays')
-        plt.ylabel('Artists')
-        plt.title('Top Played Artists')
-        plt.tight_layout()
-        plt.show()
-        
-    def show_playback_time_distribution_graph(self):
-        playback_times = [info["ms_played"] / 1000 for info in self.json_data]
-
-        plt.figure(figsize=(10, 6))
-        plt.hist(playback_times, bins=20, color='green', alpha=0.7)
-        plt.xlabel('Playback Time (seconds)')
-        plt.ylabel('Number of Songs')
-        plt.title('Distribution of Playback Times for Songs')
-        plt.tight_layout()
-        plt.show()
-
-    def show_playback_trends_graph(self):
-        plays_per_date = defaultdict(int)
-        for info in self.json_data:
-            ts = datetime.strptime(info["ts"], '%Y-%m-%dT%H:%M:%SZ')
-            date = ts.date()
-            plays_per_date[date] += 1
-
-        dates = list(plays_per_date.keys())
-        plays = [plays_per_date[date] for date in dates]
-
-        plt.figure(figsize=(10, 6))
-        plt.plot(dates, plays, marker='o')
-        plt.xlabel('Date')
-        plt.ylabel('Number of Plays')
-        plt.title('Playback Trends Over Time')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.show()
-
-    def analyze_playback_reasons(self):
-        start_reasons = Counter(info["reason_start"] for info in self.json_data)
-        end_reasons = Counter(info["reason_end"] for info in self.json_data)
-
-        results = "Playback start reasons:\n"
-        for reason, count in start_reasons.items():
-            results += f"{reason}: {count} times\n"
-
-        results += "\nPlayback end reasons:\n"
-        for reason, count in end_reasons.items():
-            results += f"{reason}: {count} times\n"
-
-        self.show_results(results)
-        start_reasons = Counter(info["reason_start"] for info in self.json_data)
-        end_reasons = Counter(info["reason_end"] for info in self.json_data)
-
-        self.results_text.insert(tk.END, "Playback start reasons:\n")
-        for reason, count in start_reasons.items():
-            self.results_text.insert(tk.END, f"{reason}: {count} times\n")
-
-        self.results_text.insert(tk.END, "\nPlayback end reasons:\n")
-        for reason, count in end_reasons.items():
-            self.results_text.insert(tk.END, f"{reason}: {count} times\n")
-
-    def export_to_excel(self):
-        if not self.json_data:
-            self.results_text.insert(tk.END, "No JSON file loaded. Please open a JSON file first.\n")
-            return
-
-        if not self.current_json_file:
-            self.results_text.insert(tk.END, "No current JSON file. Please open a JSON file first.\n")
-            return
-
-        excel_workbook = openpyxl.Workbook()
-        sheet = excel_workbook.active
-        sheet.title = "Spotify Statistics"
-
-        current_row = 1
-        sheet.cell(row=current_row, column=1, value="Date")
-        sheet.cell(row=current_row, column=2, value="Hour")
-        sheet.cell(row=current_row, column=3, value="Song")
-        sheet.cell(row=current_row, column=4, value="Artist")
-        sheet.cell(row=current_row, column=5, value="Minutes played")
-        sheet.cell(row=current_row, column=6, value="Platform")
-        sheet.cell(row=current_row, column=7, value="IP address")
-        sheet.cell(row=current_row, column=8, value="Reason start")
-        sheet.cell(row=current_row, column=9, value="Reason end")
-
-        for info in self.json_data:
-            current_row += 1
-            ts = datetime.strptime(info["ts"], '%Y-%m-%dT%H:%M:%SZ')
-            date = ts.strftime('%Y-%m-%d')
-            hour = ts.strftime('%H:%M:%S')
-            song = info["master_metadata_track_name"]
-            artist = info["master_metadata_album_artist_name"]
-            duration = info["ms_played"] / 1000 / 60
-            formatted_duration = '{:.2f}'.format(duration)
-            platform = info["platform"]
-            ip_address = info["ip_addr_decrypted"]
-            reason_start = info["reason_start"]
-            reason_end = info["reason_end"]
-
-            sheet.cell(row=current_row, column=1, value=date)
-            sheet.cell(row=current_row, column=2, value=hour)
-            sheet.cell(row=current_row, column=3, value=song)
-            sheet.cell(row=current_row, column=4, value=artist)
-            sheet.cell(row=current_row, column=5, value=formatted_duration)
-            sheet.cell(row=current_row, column=6, value=platform)
-            sheet.cell(row=current_row, column=7, value=ip_address)
-            sheet.cell(row=current_row, column=8, value=reason_start)
-            sheet.cell(row=current_row, column=9, value=reason_end)
-
-        json_file_name = os.path.splitext(os.path.basename(self.current_json_file))[0]
-        export_folder = os.path.dirname(self.current_json_file)
-        excel_file = f"{json_file_name}_History.xlsx"
-        excel_file_path = os.path.join(export_folder, excel_file)
-
-        excel_workbook.save(excel_file_path)
-    
-        export_message = f"File '{json_file_name}' exported to '{excel_file_path}'.\n"
-        
-        self.results_text.insert(tk.END, export_message)
-        self.show_results(export_message)
-        
-def main():
-    root = tk.Tk()
-    app = SpotifyAnalyzerApp(root)
-    root.mainloop()
-
-if __name__ == "__main__":
-    main()
+import os
+import tkinter as tk
+
+from tkinter import filedialog
+from collections import OrderedDict
+from aggregates import AggregateEngine
+from analysis import ANALYSES, ANALYSES_BY_LABEL, aggregate_files, load_play_store
+from charts import ChartData, ChartWindow
+from diagnostics import DiagnosticsWindow
+from excel_export import export_plays
+from ingest import history_files
+from instrumentation import instrumentation
+from jobs import JobScheduler
+from play_cache import PlayCache
+from play_index import PlayFilter, PlayIndex, filter_store
+from play_store import PlayStore
+
+MAX_FILTERED_VIEWS = 8
+
+class SpotifyAnalyzerApp:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Spotify Analyzer")
+
+        self.current_json_file = None
+        self.play_store = None
+        self.aggregates = None
+        self.play_index = None
+        self.play_filter = None
+        self.view_store = None
+        self.full_aggregates = None
+        self.filtered_views = OrderedDict()
+        self.chart_window = None
+        self.diagnostics_window = None
+        self.play_cache = PlayCache()
+        self.jobs = JobScheduler(self.root)
+
+        self.create_widgets()
+        
+    def create_widgets(self):
+        buttons_frame = tk.Frame(self.root)
+        buttons_frame.pack(pady=10)
+
+        open_file_button = tk.Button(buttons_frame, text="Open JSON File", command=self.open_file, font=("Arial", 14))
+        open_file_button.grid(row=0, column=0, padx=10)
+
+        open_folder_button = tk.Button(buttons_frame, text="Open Folder", command=self.open_folder, font=("Arial", 14))
+        open_folder_button.grid(row=0, column=1, padx=10)
+
+        analyze_button = tk.Button(buttons_frame, text="Analyze", command=self.analyze, font=("Arial", 14))
+        analyze_button.grid(row=0, column=2, padx=10)
+
+        cancel_button = tk.Button(buttons_frame, text="Cancel", command=self.cancel_jobs, font=("Arial", 14))
+        cancel_button.grid(row=0, column=3, padx=10)
+
+        exit_button = tk.Button(buttons_frame, text="Exit", command=self.exit, font=("Arial", 14))
+        exit_button.grid(row=0, column=4, padx=10)
+
+        self.skip_podcasts_var = tk.BooleanVar(self.root, value=False)
+        skip_podcasts_button = tk.Checkbutton(buttons_frame, text="Skip podcasts", variable=self.skip_podcasts_var,
+                                              font=("Arial", 12))
+        skip_podcasts_button.grid(row=1, column=0, columnspan=2, padx=10, sticky=tk.W)
+
+        options_frame = tk.Frame(self.root)
+        options_frame.pack(pady=10)
+
+        options_label = tk.Label(options_frame, text="Select an option:", font=("Arial", 16))
+        options_label.grid(row=0, column=0, padx=10)
+
+        self.options_var = tk.StringVar(self.root)
+        self.options_var.set("Show total of songs listened")
+        options_menu = tk.OptionMenu(options_frame, self.options_var,
+                             "Show total of songs listened",
+                             "Total time spent listened",
+                             "Show first and last played songs",
+                             "Show the top 5 most played songs",
+                             "Show the top 5 most played artists",
+                             "Show the most skipped songs", 
+                             "Show the average song duration",
+                             "Show daily listening patterns",
+                             "Show yearly statistics",
+                             "Show monthly statistics",
+                             "Show daily playtime statistics",
+                             "Show analysis of most used devices",
+                             "Show unique songs and artists",
+                             "Show listening sessions",
+                             "Show statistical graphs",
+                             "Analyze playback reasons",
+                             "Export statistics to Excel",
+                             "Show diagnostics")
+        options_menu.config(font=("Arial", 14))
+        options_menu.grid(row=0, column=1, padx=10)
+        self.options_var.trace_add("write", self.on_option_changed)
+
+        filter_frame = tk.Frame(self.root)
+        filter_frame.pack(pady=5)
+
+        self.filter_entries = {}
+        for column, (name, label) in enumerate((("start", "From (YYYY-MM-DD)"), ("end", "To (YYYY-MM-DD)"),
+                                                 ("platform", "Platform"), ("artist", "Artist"), ("reason", "Reason"))):
+            filter_label = tk.Label(filter_frame, text=label, font=("Arial", 12))
+            filter_label.grid(row=0, column=column, padx=5)
+            entry = tk.Entry(filter_frame, width=14, font=("Arial", 12))
+            entry.grid(row=1, column=column, padx=5)
+            self.filter_entries[name] = entry
+
+        apply_filter_button = tk.Button(filter_frame, text="Apply filter", command=self.apply_filter, font=("Arial", 12))
+        apply_filter_button.grid(row=1, column=5, padx=5)
+
+        clear_filter_button = tk.Button(filter_frame, text="Clear filter", command=self.clear_filter, font=("Arial", 12))
+        clear_filter_button.grid(row=1, column=6, padx=5)
+
+        self.filter_label = tk.Label(filter_frame, text="Filter: no filter", font=("Arial", 12))
+        self.filter_label.grid(row=2, column=0, columnspan=7, sticky=tk.W, padx=5)
+
+        results_frame = tk.Frame(self.root)
+        results_frame.pack(pady=20)
+
+        self.results_text = tk.Text(results_frame, height=20, width=50, wrap=tk.WORD, font=("Arial", 16))
+        self.results_text.grid(row=0, column=0, padx=10)
+        self.results_text.config(state=tk.DISABLED)
+
+        self.status_label = tk.Label(results_frame, text="", font=("Arial", 12))
+        self.status_label.grid(row=1, column=0, padx=10, sticky=tk.W)
+
+    def open_file(self):
+        file_path = filedialog.askopenfilename(title="Select JSON File", filetypes=[("JSON files", "*.json"), ("NDJSON files", "*.ndjson")])
+        if file_path:
+            self.cancel_view_jobs()
+            self.show_results("Loading JSON file...\n")
+            # Read here, Tk variables cannot be used from the worker thread.
+            skip_podcasts = self.skip_podcasts_var.get()
+            self.jobs.submit("load", lambda job: self.load_history(file_path, skip_podcasts, job),
+                             on_done=self.on_history_loaded,
+                             on_error=lambda e: self.on_job_error(e, "Error loading JSON file."),
+                             on_progress=self.show_progress)
+
+    def load_history(self, file_path, skip_podcasts, job):
+        with instrumentation.phase(f"load {os.path.basename(file_path)}") as phase:
+            # Each progress report is also where a cancel stops the parse.
+            play_store = self.open_json_file(file_path, skip_podcasts, lambda fraction: job.progress(fraction, "Loading"))
+            phase.rows = len(play_store)
+            job.check_cancelled()
+            aggregates = AggregateEngine(play_store)
+            aggregates.refresh(job.progress)
+        return file_path, play_store, aggregates
+
+    def on_history_loaded(self, loaded):
+        self.current_json_file, self.play_store, self.full_aggregates = loaded
+        self.play_index = PlayIndex(self.play_store)
+        self.filtered_views.clear()
+        self.set_view(None, self.play_store, self.full_aggregates)
+        self.show_progress(None)
+        self.show_results("JSON file loaded successfully.\n")
+
+    def open_folder(self):
+        folder = filedialog.askdirectory(title="Select Spotify Export Folder")
+        if folder:
+            self.cancel_view_jobs()
+            self.show_results("Analyzing folder...\n")
+            skip_podcasts = self.skip_podcasts_var.get()
+            self.jobs.submit("load", lambda job: self.load_folder(folder, skip_podcasts, job),
+                             on_done=self.on_folder_analyzed,
+                             on_error=lambda e: self.on_job_error(e, "Error analyzing folder."),
+                             on_progress=self.show_progress)
+
+    def load_folder(self, folder, skip_podcasts, job):
+        # Every file is aggregated in its own process, results are available before the plays are combined.
+        file_paths = history_files(folder)
+        if not file_paths:
+            raise FileNotFoundError(f"The folder '{folder}' does not contain any JSON files.")
+        with instrumentation.phase(f"analyze folder {os.path.basename(folder)}") as phase:
+            aggregates = aggregate_files(file_paths, play_cache=self.play_cache, progress=job.progress,
+                                         skip_podcasts=skip_podcasts)
+            phase.rows = aggregates.get("plays")
+        return folder, file_paths, skip_podcasts, aggregates
+
+    def on_folder_analyzed(self, analyzed):
+        folder, file_paths, skip_podcasts, aggregates = analyzed
+        self.current_json_file = folder
+        self.play_store = None
+        self.play_index = None
+        self.full_aggregates = aggregates
+        self.filtered_views.clear()
+        self.set_view(None, None, aggregates)
+        self.show_progress(None)
+        self.show_results(f"{len(file_paths)} files analyzed. Graphs, filters and export are available once the plays are loaded.\n")
+
+        self.jobs.submit("plays", lambda job: self.load_folder_plays(file_paths, skip_podcasts, job),
+                         on_done=self.on_folder_plays_loaded,
+                         on_error=lambda e: self.on_job_error(e, "Error loading plays."),
+                         on_progress=self.show_progress)
+
+    def load_folder_plays(self, file_paths, skip_podcasts, job):
+        # The files were just cached by the workers, their stores are read back and appended in file order.
+        with instrumentation.phase("load folder plays") as phase:
+            play_store = PlayStore(skip_podcasts)
+            for done, file_path in enumerate(file_paths):
+                job.progress(done / len(file_paths), "Loading plays")
+                file_progress = lambda fraction: job.progress((done + fraction) / len(file_paths), "Loading plays")
+                play_store.extend_store(self.open_json_file(file_path, skip_podcasts, file_progress))
+            phase.rows = len(play_store)
+        return play_store
+
+    def on_folder_plays_loaded(self, play_store):
+        self.play_store = play_store
+        self.play_index = PlayIndex(play_store)
+        self.set_view(None, play_store, self.full_aggregates)
+        self.show_progress(None)
+
+    def set_view(self, play_filter, view_store, aggregates):
+        self.play_filter = play_filter
+        self.view_store = view_store
+        self.aggregates = aggregates
+        description = play_filter.describe() if play_filter else "no filter"
+        plays = len(view_store) if view_store is not None else aggregates.get("plays")
+        self.filter_label.config(text=f"Filter: {description} ({plays} plays)")
+
+    def apply_filter(self):
+        if not self.has_plays():
+            return
+        try:
+            play_filter = PlayFilter.parse(**{name: entry.get() for name, entry in self.filter_entries.items()})
+        except ValueError as e:
+            self.handle_exception(e, "Dates must use the YYYY-MM-DD format.")
+            return
+
+        if play_filter.is_empty():
+            self.clear_filter()
+            return
+
+        # The store is passed along, a result for a history that has been replaced meanwhile is dropped.
+        play_store, play_index = self.play_store, self.play_index
+        self.jobs.submit("results", lambda job: self.build_filtered_view(play_store, play_index, play_filter, job),
+                         on_done=self.on_filter_applied,
+                         on_error=lambda e: self.on_job_error(e, "Error applying filter."),
+                         on_progress=self.show_progress)
+
+    def build_filtered_view(self, play_store, play_index, play_filter, job):
+        key = play_filter.key()
+        with instrumentation.phase(f"filter {play_filter.describe()}") as phase:
+            view = self.filtered_views.get(key)
+            if view is None:
+                view_store = filter_store(play_store, play_filter, play_index)
+                job.check_cancelled()
+                view = (view_store, AggregateEngine(view_store))
+            view[1].refresh(job.progress)
+            phase.rows = len(view[0])
+        return play_store, play_filter, view
+
+    def on_filter_applied(self, filtered):
+        play_store, play_filter, view = filtered
+        if play_store is not self.play_store:
+            self.show_progress(None)
+            return
+        self.filtered_views[play_filter.key()] = view
+        self.filtered_views.move_to_end(play_filter.key())
+        while len(self.filtered_views) > MAX_FILTERED_VIEWS:
+            self.filtered_views.popitem(last=False)
+        self.set_view(play_filter, *view)
+        self.show_progress(None)
+        self.show_current_option()
+
+    def clear_filter(self):
+        for entry in self.filter_entries.values():
+            entry.delete(0, tk.END)
+        if self.full_aggregates is not None:
+            self.set_view(None, self.play_store, self.full_aggregates)
+            self.show_current_option()
+
+    def has_plays(self):
+        if self.full_aggregates is None:
+            self.show_results("No JSON file loaded. Please open a JSON file first.\n")
+            return False
+        if self.play_store is None:
+            self.show_results("The plays are still loading, please try again in a moment.\n")
+            return False
+        return True
+
+    def show_current_option(self):
+        selected_option = self.options_var.get()
+        if selected_option in ANALYSES_BY_LABEL:
+            self.analyze()
+
+    def on_job_error(self, exception, error_message):
+        self.show_progress(None)
+        self.handle_exception(exception, error_message)
+
+    def show_progress(self, fraction, message=""):
+        if fraction is None:
+            self.status_label.config(text="")
+        else:
+            self.status_label.config(text=f"{message or 'Working'}... {fraction:.0%}")
+
+    def cancel_view_jobs(self):
+        # Plays and results of the previous history must not reach the views of the next one.
+        for panel in ("plays", "results"):
+            self.jobs.cancel(panel)
+
+    def cancel_jobs(self):
+        if self.jobs.cancel_all():
+            self.show_progress(None)
+            self.show_results("Operation cancelled.\n")
+
+    def exit(self):
+        self.jobs.shutdown()
+        self.root.destroy()
+
+    def on_option_changed(self, *args):
+        selected_option = self.options_var.get()
+        if self.full_aggregates is not None and selected_option not in ("Show statistical graphs", "Export statistics to Excel",
+                                                                        "Show diagnostics"):
+            self.analyze()
+
+    def analyze(self):
+        if self.options_var.get() == "Show diagnostics":
+            self.show_diagnostics()
+            return
+
+        if self.full_aggregates is None:
+            results = "No JSON file loaded. Please open a JSON file first.\n"
+            self.results_text.delete(1.0, tk.END)
+            self.results_text.insert(tk.END, results)
+            self.show_results(results)
+            return
+        
+        selected_option = self.options_var.get()
+
+        if selected_option == "Show statistical graphs":
+            self.show_graphs()
+        elif selected_option == "Export statistics to Excel":
+            self.export_to_excel()
+        else:
+            # Only new rows are scanned, once aggregated this is a lookup.
+            self.jobs.submit("results", lambda job: self.refresh_aggregates(self.aggregates, job),
+                             on_done=lambda _: self.show_option(selected_option),
+                             on_error=lambda e: self.on_job_error(e, "Error analyzing listening history."),
+                             on_progress=self.show_progress)
+
+    def refresh_aggregates(self, aggregates, job):
+        if aggregates.store is None or aggregates.rows_seen >= len(aggregates.store):
+            return
+        with instrumentation.phase("aggregate new plays", len(aggregates.store) - aggregates.rows_seen):
+            aggregates.refresh(job.progress)
+
+    def show_option(self, selected_option):
+        self.show_progress(None)
+
+        name = ANALYSES_BY_LABEL.get(selected_option)
+        if name is None:
+            self.show_results("Invalid option. Please choose a valid option.\n")
+        else:
+            self.show_analysis(name)
+
+    def show_analysis(self, name):
+        analysis = ANALYSES[name]
+        with instrumentation.phase(f"show {name}"):
+            with instrumentation.part("compute"):
+                result = analysis.compute(self.aggregates.results())
+            with instrumentation.part("format"):
+                text = analysis.format(result)
+            with instrumentation.part("render"):
+                self.show_results(text)
+
+    def show_results(self, results):
+        self.results_text.config(state=tk.NORMAL)
+        self.results_text.delete("1.0", tk.END)
+        self.results_text.insert(tk.END, results)
+        self.results_text.config(state=tk.DISABLED)
+        
+    def handle_exception(self, exception, error_message):
+        self.show_results(f"Error: {exception}\n{error_message}\n")
+
+    def open_json_file(self, file_path, skip_podcasts=False, progress=None):
+        # Runs on a worker thread, errors are reported through the job's on_error callback.
+        return load_play_store(file_path, self.play_cache, skip_podcasts, progress)
+
+    def show_diagnostics(self):
+        if self.diagnostics_window is not None and self.diagnostics_window.exists():
+            self.diagnostics_window.lift()
+            return
+        self.diagnostics_window = DiagnosticsWindow(self.root)
+
+    def show_graphs(self):
+        if self.chart_window is not None and self.chart_window.exists():
+            self.chart_window.lift()
+            return
+        self.chart_window = ChartWindow(self.root, self.jobs, self.display_graph,
+                                        on_error=lambda e: self.on_job_error(e, "Error drawing graph."))
+
+    def display_graph(self, chart_name):
+        if chart_name == "distribution" and not self.has_plays():
+            return
+        # Series and figures are cached per file, filter and number of plays.
+        key = (self.current_json_file, self.play_filter.key() if self.play_filter else None, self.aggregates.get("plays"))
+        self.chart_window.show(chart_name, ChartData(key, self.aggregates, self.view_store))
+
+    def export_to_excel(self):
+        if not self.has_plays():
+            return
+
+        if not self.current_json_file:
+            self.show_results("No current JSON file. Please open a JSON file first.\n")
+            return
+
+        json_file_name = os.path.splitext(os.path.basename(self.current_json_file))[0]
+        export_folder = os.path.dirname(self.current_json_file)
+        excel_file = f"{json_file_name}_History.xlsx"
+        excel_file_path = os.path.join(export_folder, excel_file)
+
+        self.show_results(f"Exporting '{json_file_name}'...\n")
+        if self.play_filter:
+            excel_file_path = os.path.join(export_folder, f"{json_file_name}_Filtered_History.xlsx")
+
+        self.jobs.submit("export", lambda job: self.write_excel(excel_file_path, job),
+                         on_done=lambda sheets: self.on_excel_exported(json_file_name, excel_file_path, sheets),
+                         on_error=lambda e: self.on_job_error(e, "Error exporting to Excel."),
+                         on_progress=self.show_progress)
+
+    def write_excel(self, excel_file_path, job):
+        with instrumentation.phase(f"export {os.path.basename(excel_file_path)}", len(self.view_store)):
+            self.aggregates.refresh(job.progress)
+            return export_plays(self.view_store, self.aggregates.results(), excel_file_path,
+                                progress=lambda fraction: job.progress(fraction, "Exporting"))
+
+    def on_excel_exported(self, json_file_name, excel_file_path, sheets):
+        self.show_progress(None)
+        export_message = f"File '{json_file_name}' exported to '{excel_file_path}'.\n"
+        if sheets > 1:
+            export_message += f"Plays were split across {sheets} sheets because of Excel's row limit.\n"
+
+        self.show_results(export_message)
+        
+def main():
+    root = tk.Tk()
+    app = SpotifyAnalyzerApp(root)
+    root.mainloop()
+
+if __name__ == "__main__":
+    main()
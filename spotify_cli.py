@@ -0,0 +1,155 @@
+import os
+import csv
+import sys
+import json
+import argparse
+
+from concurrent.futures import ProcessPoolExecutor
+from analysis import ANALYSES, analyze_file, analyze_folder
+from instrumentation import instrumentation
+from play_cache import PlayCache
+from play_index import PlayFilter
+from sessions import DEFAULT_GAP_MINUTES
+from sketches import DEFAULT_ERROR
+
+def report_rows(result):
+    # Flattens a structured analysis result into CSV rows.
+    if isinstance(result, list):
+        return result
+    if all(isinstance(value, list) for value in result.values()):
+        return [{"type": key, **row} for key, rows in result.items() for row in rows]
+    if all(isinstance(value, dict) for value in result.values()):
+        return [{"type": key, **row} for key, row in result.items()]
+    return [result]
+
+def write_json_report(reports, output_path):
+    with open(output_path, 'w', encoding='utf-8') as output:
+        json.dump(reports, output, ensure_ascii=False, indent=2)
+    return [output_path]
+
+def write_csv_reports(reports, output_prefix):
+    output_paths = []
+    for name, result in reports.items():
+        rows = report_rows(result)
+        fieldnames = []
+        for row in rows:
+            fieldnames.extend(key for key in row if key not in fieldnames)
+        output_path = f"{output_prefix}_{name}.csv"
+        with open(output_path, 'w', encoding='utf-8', newline='') as output:
+            writer = csv.DictWriter(output, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+        output_paths.append(output_path)
+    return output_paths
+
+def generate_report(file_path, names, output_dir, output_format, use_cache=True, streaming=False, play_filter=None,
+                    approximate=False, error=DEFAULT_ERROR, session_gap=DEFAULT_GAP_MINUTES, skip_podcasts=False, workers=None):
+    play_cache = PlayCache() if use_cache and not streaming else None
+    if os.path.isdir(file_path):
+        reports = analyze_folder(file_path, names, play_cache, play_filter, approximate, error, workers, session_gap,
+                                 skip_podcasts)
+    else:
+        reports = analyze_file(file_path, names, play_cache, streaming, play_filter, approximate, error, session_gap,
+                               skip_podcasts, workers or 1)
+
+    file_name = os.path.splitext(os.path.basename(os.path.normpath(file_path)))[0]
+    output_prefix = os.path.join(output_dir or os.path.dirname(os.path.abspath(file_path)), f"{file_name}_report")
+    with instrumentation.phase(f"write {output_format} report {file_name}"):
+        if output_format == "json":
+            return write_json_report(reports, output_prefix + ".json")
+        return write_csv_reports(reports, output_prefix)
+
+def generate_reports(file_paths, names=None, output_dir=None, output_format="json", workers=1, use_cache=True, streaming=False,
+                     play_filter=None, approximate=False, error=DEFAULT_ERROR, session_gap=DEFAULT_GAP_MINUTES,
+                     skip_podcasts=False):
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    jobs = [(file_path, names, output_dir, output_format, use_cache, streaming, play_filter, approximate, error, session_gap,
+             skip_podcasts) for file_path in file_paths]
+
+    if workers <= 1 or len(jobs) <= 1 or any(os.path.isdir(job[0]) for job in jobs):
+        # Folders spread their own files over the workers, they are processed one at a time.
+        for job in jobs:
+            yield job[0], generate_report(*job, workers=workers)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(generate_report, *job) for job in jobs]
+        for job, future in zip(jobs, futures):
+            yield job[0], future.result()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate Spotify listening reports without the graphical interface.')
+    parser.add_argument('files', nargs='+', help='Spotify history JSON files, or export folders analyzed file by file')
+    parser.add_argument('--analyses', nargs='+', choices=list(ANALYSES), metavar='ANALYSIS',
+                        help=f"Analyses to run (default: all). Choices: {', '.join(ANALYSES)}")
+    parser.add_argument('--format', choices=['json', 'csv'], default='json', help='Report format')
+    parser.add_argument('--output-dir', type=str, default=None, help='Report folder (defaults to each history file folder)')
+    parser.add_argument('--workers', type=int, default=1, help='Number of history files processed in parallel')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the play cache')
+    parser.add_argument('--streaming', action='store_true', help='Aggregate in batches with bounded memory, without the cache')
+    parser.add_argument('--approximate', action='store_true',
+                        help='Use bounded-memory sketches for top songs, artists, skips and unique counts')
+    parser.add_argument('--sketch-error', type=float, default=DEFAULT_ERROR,
+                        help=f'Relative error of the approximate mode (default: {DEFAULT_ERROR})')
+    parser.add_argument('--session-gap', type=float, default=DEFAULT_GAP_MINUTES,
+                        help=f'Minutes without playback that end a listening session (default: {DEFAULT_GAP_MINUTES})')
+    parser.add_argument('--skip-podcasts', action='store_true', help='Leave podcast episodes out when loading the plays')
+    parser.add_argument('--diagnostics', type=str, default=None, metavar='FILE',
+                        help='Save the time, CPU, rows and peak memory of each phase to this JSON file')
+    parser.add_argument('--profile', type=str, default=None, metavar='FOLDER',
+                        help='Save a cProfile file per phase and trace allocations (slower)')
+    parser.add_argument('--from', dest='start', type=str, default='', help='Only plays on or after this date (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='end', type=str, default='', help='Only plays on or before this date (YYYY-MM-DD)')
+    parser.add_argument('--platform', type=str, default='', help='Only plays on platforms containing this text')
+    parser.add_argument('--artist', type=str, default='', help='Only plays by artists containing this text')
+    parser.add_argument('--reason', type=str, default='', help='Only plays with a start or end reason containing this text')
+
+    args = parser.parse_args(argv)
+
+    try:
+        play_filter = PlayFilter.parse(args.start, args.end, args.platform, args.artist, args.reason)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    if not 0 < args.sketch_error < 1:
+        print("Error: --sketch-error must be between 0 and 1.")
+        return 1
+    if args.session_gap < 0:
+        print("Error: --session-gap cannot be negative.")
+        return 1
+
+    if args.profile:
+        try:
+            instrumentation.start_capture(args.profile)
+        except OSError as e:
+            print(f"Error: {e}")
+            return 1
+
+    failed = False
+    for file_path in args.files:
+        if not os.path.isfile(file_path) and not os.path.isdir(file_path):
+            print(f"Error: The file '{file_path}' does not exist.")
+            failed = True
+    if failed:
+        return 1
+
+    try:
+        for file_path, output_paths in generate_reports(args.files, args.analyses, args.output_dir,
+                                                        args.format, args.workers, not args.no_cache, args.streaming,
+                                                        play_filter, args.approximate, args.sketch_error,
+                                                        args.session_gap, args.skip_podcasts):
+            print(f"Report for '{file_path}' saved to {', '.join(output_paths)}")
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        if args.diagnostics:
+            try:
+                print(f"Diagnostics saved to {instrumentation.dump(args.diagnostics)}")
+            except OSError as e:
+                print(f"Error saving diagnostics: {e}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import os
+import time
+import random
+import argparse
+import calendar
+
+from itertools import accumulate, islice
+from merge_json import write_json_array, write_ndjson
+from play_store import TIMESTAMP_FORMAT
+
+DEFAULT_ROWS = 100000
+DEFAULT_TRACKS = 50000
+DEFAULT_ARTISTS = 5000
+DEFAULT_SHOWS = 50
+# Exponent of the Zipf popularity, the n-th most popular item is played about 1 / n ** exponent as often.
+DEFAULT_EXPONENT = 1.1
+DEFAULT_PODCAST_SHARE = 0.02
+DEFAULT_SEED = 0
+START = calendar.timegm((2015, 1, 1, 0, 0, 0))
+
+PLATFORMS = (
+    ("Android OS 12 API 31 (samsung, SM-G991B)", 45),
+    ("iOS 16.1.2 (iPhone14,5)", 20),
+    ("Windows 10 (10.0.19045; x64)", 18),
+    ("OS X 13.1.0 [x86 8]", 5),
+    ("web_player windows 10;chrome 108.0.0.0;desktop", 8),
+    ("Partner sonos_v1 Sonos;Play:1", 4),
+)
+SESSION_START_REASONS = (("clickrow", 45), ("appload", 25), ("playbtn", 20), ("remote", 10))
+COUNTRIES = (("ES", 80), ("FR", 10), ("PT", 6), ("US", 4))
+
+# Plays per session, pause between sessions and chance to skip a track early.
+MEAN_SESSION_PLAYS = 15
+MEAN_SESSION_GAP_HOURS = 10
+SKIP_RATE = 0.25
+SHUFFLE_RATE = 0.4
+OFFLINE_RATE = 0.03
+
+def zipf_weights(count, exponent):
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+def weighted(rng, choices):
+    return rng.choices([value for value, _ in choices], [weight for _, weight in choices])[0]
+
+def track_uri(prefix, index):
+    return f"spotify:{prefix}:{index:022d}"
+
+class Catalog:
+    # Songs with a fixed artist, album and duration, podcast episodes grouped in shows.
+    def __init__(self, rng, tracks=DEFAULT_TRACKS, artists=DEFAULT_ARTISTS, shows=DEFAULT_SHOWS, exponent=DEFAULT_EXPONENT):
+        # Popular artists also have more songs, each song gets its artist from the same Zipf shape.
+        artist_of = rng.choices(range(artists), cum_weights=zipf_weights(artists, exponent), k=tracks)
+        self.tracks = [(f"Song {index}", f"Artist {artist}", f"Album {artist}-{index % 7}", track_uri("track", index),
+                        rng.randint(120000, 420000)) for index, artist in enumerate(artist_of)]
+        self.track_weights = zipf_weights(tracks, exponent)
+        self.shows = shows
+        self.show_weights = zipf_weights(shows, exponent)
+
+def generate_plays(rows, tracks=DEFAULT_TRACKS, artists=DEFAULT_ARTISTS, exponent=DEFAULT_EXPONENT,
+                   podcast_share=DEFAULT_PODCAST_SHARE, seed=DEFAULT_SEED):
+    # Plays in time order with the fields of an extended streaming history, the same seed gives the same plays.
+    # Listening happens in sessions, a play ends (ts) ms_played after it starts and the next one follows it.
+    rng = random.Random(seed)
+    catalog = Catalog(rng, tracks, artists, DEFAULT_SHOWS, exponent)
+    ip_addresses = [f"83.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}" for _ in range(20)]
+    clock = START
+    remaining = 0
+    reason_start = None
+    while rows > 0:
+        if remaining == 0:
+            remaining = max(1, int(rng.expovariate(1 / MEAN_SESSION_PLAYS)))
+            clock += 1800 + int(rng.expovariate(1 / (MEAN_SESSION_GAP_HOURS * 3600)))
+            reason_start = weighted(rng, SESSION_START_REASONS)
+            platform = weighted(rng, PLATFORMS)
+            country = weighted(rng, COUNTRIES)
+            ip_address = rng.choice(ip_addresses)
+            shuffle = rng.random() < SHUFFLE_RATE
+            offline = rng.random() < OFFLINE_RATE
+
+        # Songs are drawn a session at a time, choices is much faster in bulk.
+        count = min(remaining, rows)
+        songs = rng.choices(catalog.tracks, cum_weights=catalog.track_weights, k=count)
+        for position, (track, artist, album, uri, duration) in enumerate(songs):
+            episode = rng.random() < podcast_share
+            last = position == remaining - 1
+            if episode:
+                show = rng.choices(range(catalog.shows), cum_weights=catalog.show_weights)[0]
+                duration = rng.randint(1200000, 5400000)
+            skipped = rng.random() < SKIP_RATE
+            if skipped:
+                ms_played = rng.randint(500, 30000)
+                reason_end = "fwdbtn"
+            elif last:
+                ms_played = rng.randint(0, duration)
+                reason_end = "endplay" if rng.random() < 0.7 else "logout"
+            else:
+                ms_played = duration
+                reason_end = "trackdone"
+
+            clock += rng.randint(0, 3) + ms_played // 1000
+            yield {
+                "ts": time.strftime(TIMESTAMP_FORMAT, time.gmtime(clock)),
+                "username": "synthetic_user",
+                "platform": platform,
+                "ms_played": ms_played,
+                "conn_country": country,
+                "ip_addr_decrypted": ip_address,
+                "user_agent_decrypted": "unknown",
+                "master_metadata_track_name": None if episode else track,
+                "master_metadata_album_artist_name": None if episode else artist,
+                "master_metadata_album_album_name": None if episode else album,
+                "spotify_track_uri": None if episode else uri,
+                "episode_name": f"Episode {rng.randint(1, 300)} of Show {show}" if episode else None,
+                "episode_show_name": f"Show {show}" if episode else None,
+                "spotify_episode_uri": track_uri("episode", show) if episode else None,
+                "reason_start": reason_start,
+                "reason_end": reason_end,
+                "shuffle": shuffle,
+                "skipped": skipped,
+                "offline": offline,
+                "offline_timestamp": clock if offline else 0,
+                "incognito_mode": False,
+            }
+            reason_start = "fwdbtn" if skipped else "trackdone"
+        remaining -= count
+        rows -= count
+
+def write_history(folder, rows, files=1, ndjson=False, unsorted=False, **options):
+    # Split into consecutive files named like an export, Streaming_History_Audio_0.json, ...
+    os.makedirs(folder, exist_ok=True)
+    plays = generate_plays(rows, **options)
+    width = len(str(files - 1))
+    paths = []
+    for index in range(files):
+        records = islice(plays, rows * (index + 1) // files - rows * index // files)
+        if unsorted:
+            # Shuffled plays make merge_json.py sort the file instead of streaming it.
+            records = list(records)
+            random.Random(index).shuffle(records)
+        path = os.path.join(folder, f"Streaming_History_Audio_{index:0{width}d}.{'ndjson' if ndjson else 'json'}")
+        with open(path, 'w', encoding='utf-8') as output:
+            if ndjson:
+                write_ndjson(records, output)
+            else:
+                write_json_array(records, output)
+        paths.append(path)
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write a synthetic Spotify extended streaming history.')
+    parser.add_argument('output_folder', type=str, help='Folder for the generated Streaming_History_Audio files')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help=f'Number of plays (default: {DEFAULT_ROWS})')
+    parser.add_argument('--files', type=int, default=1, help='Number of files the plays are split into')
+    parser.add_argument('--tracks', type=int, default=DEFAULT_TRACKS, help=f'Number of distinct songs (default: {DEFAULT_TRACKS})')
+    parser.add_argument('--artists', type=int, default=DEFAULT_ARTISTS, help=f'Number of distinct artists (default: {DEFAULT_ARTISTS})')
+    parser.add_argument('--exponent', type=float, default=DEFAULT_EXPONENT,
+                        help=f'Zipf exponent of song and artist popularity (default: {DEFAULT_EXPONENT})')
+    parser.add_argument('--podcasts', type=float, default=DEFAULT_PODCAST_SHARE,
+                        help=f'Share of podcast episode plays (default: {DEFAULT_PODCAST_SHARE})')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='Random seed, the same seed writes the same plays')
+    parser.add_argument('--ndjson', action='store_true', help='Write one play per line instead of a JSON array')
+    parser.add_argument('--unsorted', action='store_true', help='Shuffle the plays inside each file')
+
+    args = parser.parse_args()
+    if args.rows < 0 or args.files < 1 or args.tracks < 1 or args.artists < 1:
+        parser.error("--rows cannot be negative and --files, --tracks and --artists must be at least 1.")
+
+    paths = write_history(args.output_folder, args.rows, args.files, args.ndjson, args.unsorted, tracks=args.tracks,
+                          artists=args.artists, exponent=args.exponent, podcast_share=args.podcasts, seed=args.seed)
+    print(f"{args.rows} plays written to {', '.join(paths)}")
@@ -0,0 +1,12 @@
+from analysis import ANALYSES, analyze_file
+from synthetic_history import write_history
+
+def test_approximate_top_lists_carry_their_error_bound(tmp_path):
+    history = write_history(str(tmp_path / "history"), 3000, tracks=200, artists=50)[0]
+    exact = analyze_file(history, ["top_songs", "most_skipped"])
+    approximate = analyze_file(history, ["top_songs", "most_skipped"], approximate=True)
+    for name in ("top_songs", "most_skipped"):
+        assert not any(row["approximate"] or row["max_overcount"] for row in exact[name])
+        assert all(row["approximate"] and row["max_overcount"] > 0 for row in approximate[name])
+        assert "over-estimated by at most" in ANALYSES[name].format(approximate[name])
+        assert "over-estimated" not in ANALYSES[name].format(exact[name])
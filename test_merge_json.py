@@ -0,0 +1,14 @@
+import pytest
+
+from merge_json import merge_and_sort_json, merge_and_sort_json_streaming
+from synthetic_history import write_history
+
+@pytest.mark.parametrize("ndjson", [False, True])
+def test_streaming_merge_matches_merge(tmp_path, ndjson):
+    folder = tmp_path / "history"
+    write_history(str(folder), 3000, files=3, unsorted=True, tracks=200, artists=50)
+    merged, streamed = tmp_path / "merged", tmp_path / "streamed"
+    merge_and_sort_json(str(folder), str(merged), ndjson)
+    # A small run size makes the unsorted files go through several sorted runs.
+    merge_and_sort_json_streaming(str(folder), str(streamed), run_size=250, ndjson=ndjson)
+    assert streamed.read_text(encoding='utf-8') == merged.read_text(encoding='utf-8')
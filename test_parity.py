@@ -0,0 +1,71 @@
+import random
+
+import pytest
+import kernels
+
+from array import array
+from analysis import aggregate_files, run_analyses
+from play_store import Bitmap
+from synthetic_history import write_history
+
+# The NumPy kernels must give exactly the results of the pure Python ones.
+numpy_only = pytest.mark.skipif(kernels.np is None, reason="NumPy is not installed")
+
+@pytest.fixture
+def columns():
+    rng = random.Random(0)
+    rows = 5000
+    skipped = Bitmap()
+    skipped.extend_values(rng.random() < 0.25 for _ in range(rows))
+    return {
+        "ts": array('q', sorted(rng.randint(1420070400, 1700000000) for _ in range(rows))),
+        "ms_played": array('q', (rng.randint(0, 400000) for _ in range(rows))),
+        "day": array('i', (rng.randint(16000, 16100) for _ in range(rows))),
+        "track": array('i', (rng.randint(0, 300) for _ in range(rows))),
+        "skipped": skipped,
+    }
+
+@numpy_only
+def test_column_sum(columns):
+    assert kernels.column_sum(columns["ms_played"], "numpy") == kernels.column_sum(columns["ms_played"], "python")
+
+@numpy_only
+@pytest.mark.parametrize("values", [[], [7, 7, 7], [0, 1, 2, 3, 10, 10, 25]])
+def test_histogram_edges(values):
+    assert kernels.histogram(values, 5, "numpy") == kernels.histogram(values, 5, "python")
+
+@numpy_only
+def test_histogram(columns):
+    assert kernels.histogram(columns["ms_played"], 20, "numpy") == kernels.histogram(columns["ms_played"], 20, "python")
+
+@numpy_only
+@pytest.mark.parametrize("k", [1, 10, 50, 1000])
+def test_top_items(k):
+    # Few distinct counts, so ties at the cut must keep their order on both backends.
+    rng = random.Random(1)
+    items = [(f"song {index}", rng.randint(0, 20)) for index in range(500)]
+    assert kernels.top_items(items, k, "numpy") == kernels.top_items(items, k, "python")
+
+@numpy_only
+@pytest.mark.parametrize("start, stop", [(0, 5000), (3, 4099), (8, 16), (100, 100)])
+def test_group_totals(columns, start, stop):
+    keys = [columns["day"][start:stop], columns["track"][start:stop]]
+    values = [columns["ms_played"][start:stop]]
+    flags = [(columns["skipped"], start, stop)]
+    assert kernels.group_totals(keys, values, flags, "numpy") == kernels.group_totals(keys, values, flags, "python")
+
+@numpy_only
+@pytest.mark.parametrize("previous_end", [None, 0, 1500000000000])
+def test_session_breaks(columns, monkeypatch, previous_end):
+    results = {}
+    for backend in kernels.BACKENDS:
+        monkeypatch.setattr(kernels, "backend", backend)
+        results[backend] = kernels.session_breaks(columns["ts"], columns["ms_played"], 30 * 60 * 1000, previous_end)
+    assert results["numpy"] == results["python"]
+
+def test_split_ndjson_matches_whole_file(tmp_path):
+    # Parts of one file are merged like consecutive files, sessions across a split are joined again.
+    history = write_history(str(tmp_path / "history"), 4000, ndjson=True, tracks=200, artists=50)[0]
+    whole = aggregate_files([history], workers=1)
+    split = aggregate_files([history], workers=3)
+    assert run_analyses(split) == run_analyses(whole)
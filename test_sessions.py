@@ -0,0 +1,46 @@
+import pytest
+
+from aggregates import AggregateEngine
+from analysis import aggregate_files, analyze_file, load_play_store
+from ingest import ingest_file
+from synthetic_history import write_history
+
+@pytest.fixture
+def histories(tmp_path):
+    # The same plays, once in time order and once shuffled.
+    in_order = write_history(str(tmp_path / "sorted"), 5000, tracks=200, artists=50)[0]
+    shuffled = write_history(str(tmp_path / "shuffled"), 5000, unsorted=True, tracks=200, artists=50)[0]
+    return in_order, shuffled
+
+def sessions_report(file_path, **options):
+    return analyze_file(file_path, ["sessions"], **options)["sessions"]
+
+def test_unsorted_file_gives_the_sessions_of_the_sorted_one(histories):
+    in_order, shuffled = histories
+    expected = sessions_report(in_order)
+    assert expected["sessions"][0]["sessions"] > 100
+    assert not expected["sessions"][0]["unsorted"]
+    assert sessions_report(shuffled) == expected
+
+def test_unsorted_store_consumed_in_batches(histories):
+    in_order, shuffled = histories
+    expected = AggregateEngine(load_play_store(in_order)).get("session_summary")
+    assert AggregateEngine(load_play_store(shuffled), batch_size=700).get("session_summary") == expected
+
+def streamed_summary(file_path, batch_size):
+    aggregates = AggregateEngine()
+    ingest_file(file_path, aggregates=aggregates, batch_size=batch_size, keep_rows=False)
+    return aggregates.get("session_summary")
+
+def test_unsorted_streaming_is_reported(histories):
+    in_order, shuffled = histories
+    expected = AggregateEngine(load_play_store(in_order)).get("session_summary")
+    assert streamed_summary(in_order, 700) == expected
+    # One batch is still sorted, earlier batches are gone once the plays are streamed.
+    assert streamed_summary(shuffled, 10000) == expected
+    assert streamed_summary(shuffled, 700)["unsorted"]
+
+def test_files_out_of_time_order_are_reported(tmp_path):
+    first, second = write_history(str(tmp_path / "history"), 4000, files=2, tracks=200, artists=50)
+    assert not aggregate_files([first, second], workers=1).get("session_summary")["unsorted"]
+    assert aggregate_files([second, first], workers=1).get("session_summary")["unsorted"]